@@ -1,29 +1,214 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
 import throughput
 import autoscaling
+import autoscale_engine
+import cache
+import collector
+import events
+import instrumentation
+import history
+import tracing
+import whatif
+import math
+import time
 import yaml
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from datetime import datetime, timezone
 
 app = Flask(__name__)
 
+# Shared background collector: every client reads the same snapshot
+metrics_collector = collector.MetricsCollector(throughput.PROM_QUERY_INTERVAL_SECONDS)
+
+# Samples from every default-period snapshot, for range queries without Prometheus
+history_store = history.HistoryStore(
+    retention_seconds=throughput.HISTORY_RETENTION_SECONDS,
+    resolution_seconds=throughput.HISTORY_RESOLUTION_SECONDS,
+    max_series=throughput.HISTORY_MAX_SERIES
+)
+
+def record_history(snapshot):
+    if snapshot.period == metrics_collector.default_period:
+        history_store.record_snapshot(snapshot)
+
+metrics_collector.add_listener(record_history)
+
+# Seconds between keep-alive comments on idle /api/stream connections
+STREAM_HEARTBEAT_SECONDS = 15
+
+def push_snapshot(snapshot):
+    """Send connected dashboards the rows that changed since the previous snapshot of the period."""
+    if not events.bus.subscriber_count():
+        return
+    since = metrics_collector.previous_generation(snapshot)
+    delta = metrics_collector.get_delta(snapshot, since) if since is not None else None
+    if delta is None:
+        # Nothing to diff against: tell clients to fetch the snapshot themselves
+        events.bus.publish('metrics', {'period': snapshot.period, 'generation': snapshot.token, 'delta': False})
+    else:
+        events.bus.publish('metrics', collector.snapshot_response_body(snapshot, True, delta, since))
+
+metrics_collector.add_listener(push_snapshot)
+metrics_collector.start()
+
+# Autoscaling runs from the latest snapshot, on its own schedule and as soon as a new
+# snapshot is published, never on a request
+autoscaler = autoscale_engine.AutoscaleEngine(
+    metrics_collector,
+    throughput.AUTOSCALE_INTERVAL_SECONDS,
+    max_workers=throughput.AUTOSCALE_MAX_WORKERS,
+    history_store=history_store
+)
+metrics_collector.add_listener(lambda snapshot: autoscaler.wake())
+autoscaler.start()
+autoscaling.task_tracker.start()
+# Scale tasks a previous run left unfinished keep their databases in_progress until tracked
+autoscaling.resume_task_tracking()
+
+def _parse_time(value):
+    """Parse epoch seconds or an ISO 8601 timestamp (UTC if no offset is given)."""
+    try:
+        timestamp = float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    # float() also accepts nan and inf, which would pass the window checks
+    if not math.isfinite(timestamp):
+        raise ValueError('timestamp must be finite')
+    return timestamp
+
+# Accepted values of ?trace= on /api/metrics and ?format= on /api/trace
+TRACE_FORMATS = ('breakdown', 'spans', 'folded')
+
+def _trace_report(trace, trace_format):
+    """A finished trace as folded stacks (text/plain) or a JSON-serializable dict"""
+    if trace_format == 'folded':
+        return trace.folded()
+    report = trace.breakdown()
+    if trace_format == 'spans':
+        report['spans'] = trace.spans(min_ms=request.args.get('min_ms', 0, type=float))
+    return report
+
+def _parse_trace_format(value):
+    trace_format = 'breakdown' if value in ('1', 'true') else value
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"trace must be 1 or one of {', '.join(TRACE_FORMATS)}")
+    return trace_format
+
 @app.route('/api/metrics')
 def metrics():
+    compact = request.args.get('format') == 'compact'
+    abs_from = request.args.get('abs_from')
+    abs_to = request.args.get('abs_to')
+    trace_format = None
+    if 'trace' in request.args:
+        try:
+            trace_format = _parse_trace_format(request.args['trace'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if abs_from and abs_to:
+        # Absolute windows bypass the shared snapshot; closed windows come from cache
+        try:
+            start = _parse_time(abs_from)
+            end = min(_parse_time(abs_to), time.time())
+        except ValueError as e:
+            return jsonify({'error': f'Invalid absolute time range: {e}'}), 400
+        if start >= end:
+            return jsonify({'error': 'abs_from must be before abs_to'}), 400
+        window = {'abs_from': start, 'abs_to': end}
+    else:
+        window = None
+    if trace_format:
+        # Traced requests collect directly instead of reading the shared snapshot
+        window = window or {'period': request.args.get('period') or metrics_collector.default_period}
+        with tracing.start_trace('metrics') as trace:
+            data = throughput.get_all_metrics(**window)
+        report = _trace_report(trace, trace_format)
+        if trace_format == 'folded':
+            return Response(report, mimetype='text/plain')
+        return Response(collector.encode_body(data, compact, trace=report, **window), mimetype='application/json')
+    if window:
+        data = throughput.get_all_metrics(**window)
+        return Response(collector.encode_body(data, compact, **window), mimetype='application/json')
     period = request.args.get('period', None)
-    data = throughput.get_all_metrics(period=period)
-    # For each enabled database, check and trigger autoscale if needed
-    enabled = autoscaling.get_all_autoscale_enabled()
-    for entry in data["databases"]:
-        sub_id = str(entry.get('subscription_id'))
-        db_id = str(entry.get('database_id'))
-        if (sub_id, db_id) in enabled:
-            autoscaling.autoscale_database(
-                sub_id,
-                entry,
-                entry['metrics_autoscale'],
-                entry.get('thresholds', {}),
-                entry.get('max_scaling', {}),
-                data["databases"]  # Pass all databases to check if all are active
-            )
-    return jsonify(data)
+    snapshot = metrics_collector.get_snapshot(period)
+    # Clients that pass the generation they already have get only what changed since
+    delta = None
+    since = request.args.get('since')
+    if since is not None:
+        delta = metrics_collector.get_delta(snapshot, since)
+    return Response(collector.snapshot_response_body(snapshot, compact, delta, since), mimetype='application/json')
+
+@app.route('/api/trace')
+def get_trace():
+    """Span breakdown of the last background refresh of a period (requires tracing_enabled)"""
+    try:
+        trace_format = _parse_trace_format(request.args.get('format', 'breakdown'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    trace = metrics_collector.last_trace(request.args.get('period'))
+    if trace is None:
+        return jsonify({'error': 'No trace recorded; set tracing_enabled in config.yaml or use /api/metrics?trace=1'}), 404
+    report = _trace_report(trace, trace_format)
+    if trace_format == 'folded':
+        return Response(report, mimetype='text/plain')
+    return jsonify(report)
+
+@app.route('/api/stream')
+def stream():
+    """Server-Sent Events: metrics deltas, autoscale status/toggle changes and task completions."""
+    subscriber = events.bus.subscribe()
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            # Fell too far behind: close at once, so the browser reconnects and resyncs
+            # instead of replaying stale queued events first
+            while not subscriber.overflowed:
+                event = subscriber.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield events.format_sse(*event)
+        finally:
+            subscriber.close()
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/history')
+def get_history():
+    subscription_id = request.args.get('subscription_id')
+    database_id = request.args.get('database_id')
+    metric = request.args.get('metric', 'throughput')
+    if not subscription_id or not database_id or metric not in history.HISTORY_METRICS:
+        return jsonify({'error': 'subscription_id, database_id and a valid metric are required'}), 400
+    try:
+        end = float(request.args.get('end', time.time()))
+        if 'start' in request.args:
+            start = float(request.args['start'])
+        else:
+            start = end - history.parse_duration(request.args.get('range', '1h'))
+        step = history.parse_duration(request.args['step']) if 'step' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result = history_store.query(f"{subscription_id}_{database_id}", metric, start, end, step)
+    result.update({'metric': metric, 'start': start, 'end': end, 'step': step})
+    return jsonify(result)
+
+@app.route('/api/history/stats')
+def get_history_stats():
+    return jsonify(history_store.stats())
+
+@app.route('/api/what-if', methods=['POST'])
+def what_if():
+    try:
+        scenario = whatif.parse_scenario(request.get_json(silent=True) or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(stream_with_context(whatif.stream_what_if(scenario)), mimetype='application/x-ndjson')
 
 @app.route('/api/autoscale/enable', methods=['POST'])
 def enable_autoscale():
@@ -49,14 +234,36 @@ def get_enabled_autoscale():
 def autoscaling_status():
     return jsonify(autoscaling.get_autoscale_status())
 
+@app.route('/api/autoscale/engine')
+def autoscale_engine_status():
+    return jsonify(autoscaler.get_status())
+
+@app.route('/api/autoscale/tasks')
+def autoscale_tasks():
+    return jsonify(autoscaling.task_tracker.get_tasks())
+
+def _snapshot_age():
+    snapshot = metrics_collector.latest(metrics_collector.default_period)
+    return time.time() - snapshot.collected_at if snapshot else float('nan')
+
+instrumentation.SNAPSHOT_AGE.set_function(_snapshot_age)
+
+@app.route('/metrics')
+def self_metrics():
+    """The dashboard's own metrics in the Prometheus text format"""
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    return jsonify(cache.all_cache_stats())
+
 @app.route('/api/refresh-cloud', methods=['POST'])
 def refresh_cloud():
     # Clear the cache and force a fresh fetch from the Cloud API
-    throughput._redis_cache['subscriptions'] = None
-    throughput._redis_cache['databases'] = {}
-    throughput._redis_cache['last_fetch'] = None
+    throughput.clear_inventory_cache()
     # Fetch fresh data
     throughput.get_subscriptions_cached()
+    metrics_collector.invalidate()
     return jsonify({'success': True})
 
 @app.route('/api/config')
@@ -0,0 +1,367 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import autoscaling
+import forecast
+import instrumentation
+import throughput
+
+class AutoscaleEngine:
+    """
+    Evaluates autoscaling for enabled databases on its own schedule, using the latest
+    collector snapshot, and hands scale actions to a worker pool. Nothing here runs on
+    an HTTP request.
+
+    Every database of a subscription that needs scaling goes into that subscription's
+    plan, which scales them one after another, each as soon as the previous change has
+    finished, instead of one per evaluation.
+    """
+
+    def __init__(self, metrics_collector, interval_seconds, max_workers=4, history_store=None):
+        self.metrics_collector = metrics_collector
+        self.history_store = history_store  # Samples for predictive scaling; None disables it
+        self.interval_seconds = interval_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='autoscale')
+        self._in_flight = set()  # set of (subscription_id, database_id) tuples queued or scaling
+        self._plans = {}  # {subscription_id: plan}, see _new_plan
+        self._recent_plans = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_run = None
+        self._last_generation = None
+        self._actions_submitted = 0
+        self._forecast_actions_submitted = 0
+        self._last_forecasts = {}  # {db_key: forecast} that triggered a scale-up in the last run
+        self._leader_token = None  # Engine leader lease held by this process, if any
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='autoscale-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            token, self._leader_token = self._leader_token, None
+        if token:
+            autoscaling.state.release_lease('autoscale-engine', token)
+
+    def wake(self):
+        """Evaluate now instead of at the next interval, e.g. when a new snapshot is published."""
+        self._wakeup.set()
+
+    def get_status(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'interval_seconds': self.interval_seconds,
+                'last_run': self._last_run,
+                'last_generation': self._last_generation,
+                'in_flight': [list(key) for key in sorted(self._in_flight)],
+                'plans': [_public_plan(plan) for plan in self._plans.values()],
+                'recent_plans': list(self._recent_plans),
+                'actions_submitted': self._actions_submitted,
+                'forecast_actions_submitted': self._forecast_actions_submitted,
+                'last_forecasts': dict(self._last_forecasts),
+                'leader': self._leader_token is not None,
+            }
+
+    def run_once(self):
+        """
+        Evaluate the latest snapshot and submit any scale actions it calls for.
+        With a shared state backend only the process holding the engine leader lease
+        evaluates; the others stand by and take over when the lease expires.
+        """
+        if not self._hold_leadership():
+            return 0
+        with instrumentation.phase_timer('autoscale'):
+            return self._evaluate()
+
+    def _hold_leadership(self):
+        ttl = max(3 * self.interval_seconds, throughput.AUTOSCALE_LOCK_LEASE_SECONDS)
+        token = autoscaling.state.acquire_lease('autoscale-engine', ttl, token=self._leader_token)
+        with self._lock:
+            self._leader_token = token
+        return token is not None
+
+    def _evaluate(self):
+        self._resume_plans()
+        snapshot = self.metrics_collector.get_snapshot()
+        with self._lock:
+            self._last_run = time.time()
+            if snapshot.generation == self._last_generation:
+                return 0
+            self._last_generation = snapshot.generation
+        databases = snapshot.data["databases"]
+        enabled = set(autoscaling.get_all_autoscale_enabled())
+        steps = []
+        candidates = []  # Enabled databases below their thresholds, to forecast
+        for entry in databases:
+            key = (str(entry.get('subscription_id')), str(entry.get('database_id')))
+            if key not in enabled or 'metrics_autoscale' not in entry:
+                continue
+            needs = autoscaling.is_autoscale_needed(entry['metrics_autoscale'], entry.get('thresholds', {}), entry.get('max_scaling', {}))
+            if not any(needs.values()):
+                candidates.append(entry)
+                continue
+            steps.append(_plan_step(entry, entry['metrics_autoscale'], 'threshold'))
+        forecasting = throughput.AUTOSCALE_FORECAST_ENABLED and self.history_store is not None
+        if forecasting:
+            steps += self._scale_ahead(candidates)
+        scheduled = self._schedule(steps, databases)
+        if forecasting:
+            triggered = {f"{step['subscription_id']}_{step['database_id']}": step['forecast'] for step in scheduled if step['reason'] == 'forecast'}
+            for db_key, result in triggered.items():
+                print(f"Scaling DB {db_key.split('_', 1)[1]} ahead of forecast threshold crossing: {result}")
+            with self._lock:
+                self._forecast_actions_submitted += len(triggered)
+                self._last_forecasts = triggered
+        return len(scheduled)
+
+    def _scale_ahead(self, candidates):
+        """Plan steps for databases whose usage trend crosses a threshold before a scale task could finish"""
+        forecasts = forecast.forecast_scaling(
+            self.history_store, candidates,
+            throughput.AUTOSCALE_FORECAST_HORIZON_SECONDS,
+            throughput.AUTOSCALE_FORECAST_LOOKBACK_SECONDS,
+            throughput.AUTOSCALE_FORECAST_MIN_SAMPLES
+        )
+        steps = []
+        for entry in candidates:
+            result = forecasts.get(f"{entry.get('subscription_id')}_{entry.get('database_id')}")
+            if result is None:
+                continue
+            # Sized by the usual steps and caps, from the usage projected at the horizon
+            needs = autoscaling.is_autoscale_needed(result['metrics'], entry.get('thresholds', {}), entry.get('max_scaling', {}))
+            if any(needs.values()):
+                steps.append(_plan_step(entry, result['metrics'], 'forecast', result['forecast']))
+        return steps
+
+    def _schedule(self, steps, databases):
+        """
+        Merge this run's steps into one plan per subscription, most urgent first, and
+        start the plans that were idle. Steps of databases already queued only refresh
+        their metrics. returns: the steps that were added
+        """
+        steps.sort(key=_urgency)
+        added = []
+        start = []
+        with self._lock:
+            for step in steps:
+                key = (step['subscription_id'], step['database_id'])
+                plan = self._plans.get(key[0])
+                if plan is None:
+                    plan = self._plans[key[0]] = _new_plan(key[0])
+                    start.append(key[0])
+                plan['databases'] = databases
+                if key in self._in_flight:
+                    for queued in plan['queue']:
+                        if queued['database_id'] == key[1]:
+                            queued['metrics'] = step['metrics']
+                    continue
+                self._in_flight.add(key)
+                self._actions_submitted += 1
+                plan['queue'].append(step)
+                plan['updated_at'] = time.time()
+                added.append(step)
+        for subscription_id in start:
+            self._executor.submit(self._advance, subscription_id)
+        instrumentation.AUTOSCALE_ACTIONS.labels('submitted').inc(len(added))
+        return added
+
+    def _resume_plans(self):
+        """Restart plans that stopped because another process held their subscription's lease"""
+        with self._lock:
+            waiting = [plan['subscription_id'] for plan in self._plans.values() if plan['state'] == 'waiting_for_lease']
+            for subscription_id in waiting:
+                self._plans[subscription_id]['state'] = 'running'
+        for subscription_id in waiting:
+            self._executor.submit(self._advance, subscription_id)
+
+    def _advance(self, subscription_id):
+        """
+        Run a subscription's plan one step at a time under its subscription lease. A step
+        that started a Cloud API task hands over to _on_step_task_complete, which resumes
+        the plan once the task has finished and the subscription accepts changes again.
+        """
+        lease_name = f"subscription:{subscription_id}"
+        while True:
+            with self._lock:
+                plan = self._plans[subscription_id]
+                if not plan['queue']:
+                    del self._plans[subscription_id]
+                    plan['state'] = 'finished'
+                    plan['finished_at'] = time.time()
+                    self._recent_plans.appendleft(_public_plan(plan))
+                    token, plan['lease'] = plan['lease'], None
+                    break
+                step = plan['queue'][0]
+                token = plan['lease']
+            try:
+                token = autoscaling.state.acquire_lease(lease_name, _plan_lease_seconds(), token=token)
+            except Exception as e:
+                print(f"Could not take the scale lease of subscription {subscription_id}: {e}")
+                with self._lock:
+                    plan['state'] = 'waiting_for_lease'
+                return
+            with self._lock:
+                plan['lease'] = token
+                plan['lease_renewed_at'] = time.time() if token else None
+                if token is None:
+                    plan['state'] = 'waiting_for_lease'
+                    print(f"Autoscale already in progress for subscription {subscription_id}, plan waits for the next run.")
+                    return
+                plan['queue'].popleft()
+                plan['current'] = step
+                plan['state'] = 'running'
+                step['status'] = 'in_progress'
+                step['started_at'] = time.time()
+            outcome = self._scale(subscription_id, step, plan['databases'], token)
+            if outcome == 'waiting_for_task':
+                return
+            self._finish_step(plan, step, outcome)
+        if token:
+            autoscaling.state.release_lease(lease_name, token)
+
+    def _scale(self, subscription_id, step, databases, lease):
+        """Run one plan step; returns its outcome, or 'waiting_for_task' while its Cloud API task runs"""
+        entry = step['entry']
+        try:
+            result = autoscaling.autoscale_database(
+                subscription_id,
+                entry,
+                step['metrics'],
+                entry.get('thresholds', {}),
+                entry.get('max_scaling', {}),
+                databases,  # Pass all databases to check if all are active
+                lease=lease,
+                on_task_complete=lambda task: self._on_step_task_complete(subscription_id, step, task),
+                on_task_poll=lambda task: self._renew_plan_lease(subscription_id)
+            )
+        except Exception as e:
+            print(f"Autoscale failed for DB {step['database_id']}: {e}")
+            autoscaling.set_autoscale_status(step['database_id'], 'failed')
+            return 'failed'
+        if isinstance(result, str):
+            with self._lock:
+                # The task may already have finished on a tracker thread
+                if step['status'] == 'in_progress':
+                    step['status'] = 'waiting_for_task'
+                    step['task_id'] = result
+                    self._plans[subscription_id]['state'] = 'waiting_for_task'
+                    return 'waiting_for_task'
+            return step['status']
+        return 'done' if result else 'skipped'
+
+    def _renew_plan_lease(self, subscription_id):
+        """
+        Keep the subscription lease while a step's task runs, which can take longer than
+        autoscale_lock_lease_seconds; called on every poll of the task.
+        """
+        with self._lock:
+            plan = self._plans.get(subscription_id)
+            token = plan['lease'] if plan else None
+        if token is None:
+            return
+        renewed = autoscaling.state.acquire_lease(f"subscription:{subscription_id}", _plan_lease_seconds(), token=token)
+        with self._lock:
+            if renewed is None:
+                print(f"Lost the scale lease of subscription {subscription_id} while its task runs")
+                plan['lease'] = None
+            else:
+                plan['lease_renewed_at'] = time.time()
+
+    def _on_step_task_complete(self, subscription_id, step, task):
+        with self._lock:
+            plan = self._plans.get(subscription_id)
+            waiting = step['status'] == 'waiting_for_task'
+            step['task_id'] = task['task_id']
+            step['status'] = task['outcome']
+        if plan is None or not waiting:
+            return
+        self._finish_step(plan, step, task['outcome'])
+        try:
+            self._executor.submit(self._advance, subscription_id)
+        except RuntimeError:
+            pass  # The engine was stopped
+
+    def _finish_step(self, plan, step, outcome):
+        with self._lock:
+            step['status'] = outcome
+            step['finished_at'] = time.time()
+            plan['current'] = None
+            plan['completed'].append(_public_step(step))
+            plan['updated_at'] = step['finished_at']
+            self._in_flight.discard((step['subscription_id'], step['database_id']))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Autoscale evaluation failed: {e}")
+            self._wakeup.wait(self.interval_seconds)
+            self._wakeup.clear()
+
+def _plan_lease_seconds():
+    """Plan lease expiry: long enough to outlast the gap between two polls of a task"""
+    return max(throughput.AUTOSCALE_LOCK_LEASE_SECONDS, 3 * autoscaling.task_tracker.max_delay)
+
+def _plan_step(entry, metrics, reason, forecast_result=None):
+    step = {
+        'subscription_id': str(entry.get('subscription_id')),
+        'database_id': str(entry.get('database_id')),
+        'database_name': entry.get('database_name'),
+        'reason': reason,  # 'threshold', or 'forecast' for a projected crossing
+        'status': 'queued',
+        'task_id': None,
+        'queued_at': time.time(),
+        'entry': entry,
+        'metrics': metrics,
+    }
+    if forecast_result is not None:
+        step['forecast'] = forecast_result
+    return step
+
+def _urgency(step):
+    """Sort key: databases over their thresholds first, then by the highest share of a limit in use"""
+    metrics = step['metrics']
+    usage = max(
+        (metrics.get('throughput') or 0) / (metrics.get('throughput_limit') or float('inf')),
+        (metrics.get('memory') or 0) / (metrics.get('memory_limit_bytes') or float('inf'))
+    )
+    return (step['reason'] != 'threshold', -usage)
+
+def _new_plan(subscription_id):
+    return {
+        'subscription_id': subscription_id,
+        # 'running'; 'waiting_for_task' while a step's Cloud API task runs, holding the
+        # subscription lease and renewing it on every poll of the task; 'waiting_for_lease'
+        # while another process holds it; 'finished'
+        'state': 'running',
+        'queue': deque(),
+        'current': None,
+        'completed': [],
+        'databases': [],
+        'lease': None,
+        'lease_renewed_at': None,
+        'created_at': time.time(),
+        'updated_at': time.time(),
+    }
+
+def _public_step(step):
+    return {key: value for key, value in step.items() if key not in ('entry', 'metrics')}
+
+def _public_plan(plan):
+    public = {key: value for key, value in plan.items() if key not in ('queue', 'current', 'completed', 'databases', 'lease')}
+    public['current'] = _public_step(plan['current']) if plan['current'] else None
+    public['queued'] = [_public_step(step) for step in plan['queue']]
+    public['completed'] = list(plan['completed'])
+    return public
@@ -1,31 +1,69 @@
 import requests
 import os
-from dotenv import load_dotenv
 import threading
+from dotenv import load_dotenv
 import time
 import throughput  # Import to access scaling configuration
+import events
+import instrumentation
+from journal import Journal
+from state import create_state_backend
+from task_tracker import TaskTracker
 
 load_dotenv()
 
 API_KEY = os.getenv("REDIS_CLOUD_API_KEY")
 API_SECRET = os.getenv("REDIS_CLOUD_API_SECRET")
-API_URL = "https://api.redislabs.com/v1"
+API_URL = throughput.API_URL
 
 # Get scaling percentages from configuration
 MEMORY_SCALING_PERCENTAGE = throughput.MEMORY_SCALING_PERCENTAGE
 THROUGHPUT_SCALING_PERCENTAGE = throughput.THROUGHPUT_SCALING_PERCENTAGE
 
-# In-memory lock to prevent parallel autoscaling per subscription
-_autoscale_locks = {}
+# Enabled databases, statuses, recent actions and per-subscription scale locks live in
+# the state backend, so several app processes share them (autoscale_state_backend)
+state = create_state_backend(
+    throughput.AUTOSCALE_STATE_BACKEND,
+    path=throughput.AUTOSCALE_STATE_PATH,
+    url=throughput.AUTOSCALE_STATE_REDIS_URL
+)
+
+def _journal_snapshot():
+    """The journal records that rebuild the current state: enabled databases and the last action per database"""
+    records = [{'op': 'enable', 'subscription_id': sub_id, 'database_id': db_id} for sub_id, db_id in state.list_enabled()]
+    records += [dict(action, op='action', database_id=db_id) for db_id, action in state.list_recent_actions().items()]
+    return records
 
-# In-memory status for UI indication
-_autoscale_status = {}  # {database_id: 'in_progress'|'done'}
+def _replay_journal(records):
+    for record in records:
+        if record['op'] == 'enable':
+            state.enable(record['subscription_id'], record['database_id'])
+        elif record['op'] == 'disable':
+            state.disable(record['subscription_id'], record['database_id'])
+        elif record['op'] == 'action':
+            state.put_recent_action(record['database_id'], {
+                key: value for key, value in record.items() if key not in ('op', 'database_id')
+            })
 
-# In-memory tracking of autoscaling-enabled databases
-_autoscale_enabled = set()  # set of (subscription_id, database_id) tuples
+# Shared backends are durable themselves; the in-memory one is rebuilt from the journal on startup
+journal = None
+_journal_lock = threading.Lock()  # Keeps journal order identical to the order changes were applied
+if throughput.AUTOSCALE_STATE_BACKEND == 'memory' and throughput.AUTOSCALE_JOURNAL_PATH:
+    journal = Journal(
+        throughput.AUTOSCALE_JOURNAL_PATH,
+        _journal_snapshot,
+        fsync=throughput.AUTOSCALE_JOURNAL_FSYNC,
+        compact_after=throughput.AUTOSCALE_JOURNAL_COMPACT_AFTER
+    )
+    _replay_journal(journal.load())
+    journal.compact()
 
-# Track recent autoscaling actions to prevent duplicates
-_recent_autoscale_actions = {}  # {database_id: {'values': dict, 'timestamp': float, 'task_id': str}}
+def _record(apply, record):
+    """Apply a state change and append it to the journal, if there is one"""
+    with _journal_lock:
+        apply()
+        if journal is not None:
+            journal.append(record)
 
 def is_autoscale_needed(db_metrics, thresholds, max_scaling):
     """
@@ -121,7 +159,7 @@ def get_database_config(subscription_id, database_id):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = instrumentation.cloud_api_request('database', requests.get, url, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
@@ -154,9 +192,9 @@ def filter_allowed_update_fields(config):
     
     return filtered_config
 
-def check_task_status(task_id):
+def get_task(task_id):
     """
-    Check the status of a Redis Cloud API task.
+    Get a Redis Cloud API task, or None if it could not be read.
     """
     url = f"{API_URL}/tasks/{task_id}"
     headers = {
@@ -166,18 +204,65 @@ def check_task_status(task_id):
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = instrumentation.cloud_api_request('tasks', requests.get, url, headers=headers, timeout=30)
         if response.status_code == 200:
-            task_data = response.json()
-            status = task_data.get('status', 'unknown')
-            print(f"Task {task_id} status: {status}")
-            return status
+            return response.json()
         else:
             print(f"Failed to check task status: {response.status_code} - {response.text}")
-            return 'unknown'
+            return None
     except Exception as e:
         print(f"Error checking task status: {e}")
+        return None
+
+def check_task_status(task_id):
+    """
+    Check the status of a Redis Cloud API task.
+    """
+    task_data = get_task(task_id)
+    if task_data is None:
         return 'unknown'
+    status = task_data.get('status', 'unknown')
+    print(f"Task {task_id} status: {status}")
+    return status
+
+# Background tracking of scale tasks until they finish
+task_tracker = TaskTracker(get_task)
+
+def _on_task_complete(task):
+    _record_task_outcome(task)
+    set_autoscale_status(task['database_id'], task['outcome'])
+    events.bus.publish('task', task)
+
+def _record_task_outcome(task):
+    """Mark the recent action that started a task as finished, so it is not resumed after a restart"""
+    database_id = str(task['database_id'])
+    action = state.get_recent_action(database_id)
+    if action is None or action.get('task_id') != task['task_id']:
+        return
+    action['outcome'] = task['outcome']
+    _record(lambda: state.put_recent_action(database_id, action),
+            dict(action, op='action', database_id=database_id))
+
+def resume_task_tracking():
+    """
+    Track again the scale tasks started before a restart that were never seen to finish:
+    recent actions with a task_id and no outcome. Their timeout counts from when the
+    scale request was sent.
+    returns: number of tasks resumed
+    """
+    resumed = 0
+    for database_id, action in state.list_recent_actions().items():
+        if not action.get('task_id') or action.get('outcome'):
+            continue
+        task_tracker.track(
+            action['task_id'], action.get('subscription_id'), database_id, action.get('values'),
+            on_complete=_on_task_complete, created_at=action.get('timestamp')
+        )
+        set_autoscale_status(database_id, 'in_progress')
+        resumed += 1
+    if resumed:
+        print(f"Resumed tracking {resumed} scale task(s) started before the restart")
+    return resumed
 
 def is_duplicate_request(database_id, new_values):
     """
@@ -185,8 +270,8 @@ def is_duplicate_request(database_id, new_values):
     """
     current_time = time.time()
     
-    if database_id in _recent_autoscale_actions:
-        last_action = _recent_autoscale_actions[database_id]
+    last_action = state.get_recent_action(str(database_id))
+    if last_action:
         # Check if it's the same values and within 5 minutes
         if (last_action['values'] == new_values and 
             current_time - last_action['timestamp'] < 300):  # 5 minutes
@@ -194,146 +279,91 @@ def is_duplicate_request(database_id, new_values):
     
     return False
 
-def update_recent_action(database_id, new_values, task_id=None):
+def update_recent_action(database_id, new_values, task_id=None, subscription_id=None):
     """
     Update the tracking of recent autoscaling actions.
     """
-    _recent_autoscale_actions[database_id] = {
+    action = {
         'values': new_values,
         'timestamp': time.time(),
-        'task_id': task_id
+        'task_id': task_id,
+        'subscription_id': str(subscription_id) if subscription_id is not None else None
     }
+    _record(lambda: state.put_recent_action(str(database_id), action),
+            dict(action, op='action', database_id=str(database_id)))
 
 def is_duplicate_task_check(database_id, task_id):
     """
     Check if we've already checked this task status.
     """
-    if database_id in _recent_autoscale_actions:
-        last_action = _recent_autoscale_actions[database_id]
-        if last_action.get('task_id') == task_id:
-            return True
+    last_action = state.get_recent_action(str(database_id))
+    if last_action and last_action.get('task_id') == task_id:
+        return True
     return False
 
-def update_database_scaling(subscription_id, database_id, new_values):
+def update_database_scaling(subscription_id, database_id, new_values, on_task_complete=None, on_task_poll=None):
     """
     Call the Redis Cloud API to update the database scaling values.
     Only sends the specific fields that need updating.
+    Returns the API response, which holds a 'taskId' when the change runs as a task;
+    the task is handed to task_tracker instead of being waited on, and
+    on_task_complete(task) is called as well once it finishes (on_task_poll(task)
+    after every poll until then).
     """
     # Check for duplicate request
     if is_duplicate_request(database_id, new_values):
         print(f"Skipping duplicate autoscaling request for DB {database_id}")
         return None
     
-    # Get current database configuration
-    current_config = get_database_config(subscription_id, database_id)
-    if not current_config:
-        print(f"Could not get current configuration for DB {database_id}, trying direct update...")
-        # Fallback to direct update with only the new values
-        url = f"{API_URL}/subscriptions/{subscription_id}/databases/{database_id}"
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "x-api-key": API_KEY,
-            "x-api-secret-key": API_SECRET
-        }
-        print(f"Updating database scaling: {url}")
-        print(f"Request body: {new_values}")
+    url = f"{API_URL}/subscriptions/{subscription_id}/databases/{database_id}"
+    headers = {
+        "accept": "application/json",
+        "content-type": "application/json",
+        "x-api-key": API_KEY,
+        "x-api-secret-key": API_SECRET
+    }
+    print(f"Updating database scaling: {url}")
+    print(f"Request body: {new_values}")
+    
+    try:
+        response = instrumentation.cloud_api_request('scale', requests.put, url, headers=headers, json=new_values, timeout=30)
+        print(f"API Response Status: {response.status_code}")
+        print(f"API Response Body: {response.text}")
         
-        try:
-            response = requests.put(url, headers=headers, json=new_values)
-            print(f"API Response Status: {response.status_code}")
-            print(f"API Response Body: {response.text}")
-            
-            if response.status_code not in (200, 202):
-                print(f"API Error Response: {response.status_code} - {response.text}")
-                raise Exception(f"Failed to update database scaling: {response.status_code} {response.text}")
-            
-            # If it's a 202 response, check the task status
-            if response.status_code == 202:
-                response_data = response.json()
-                task_id = response_data.get('taskId')
-                if task_id:
-                    print(f"Task created: {task_id}")
-                    # Update tracking with task ID
-                    update_recent_action(database_id, new_values, task_id)
-                    # Wait a bit and check task status
-                    time.sleep(2)
-                    task_status = check_task_status(task_id)
-                    if task_status in ['completed', 'success']:
-                        print(f"Successfully updated database scaling for DB {database_id}")
-                        return response_data
-                    elif task_status in ['failed', 'error']:
-                        raise Exception(f"Task failed with status: {task_status}")
-                    else:
-                        print(f"Task status: {task_status} - will check again later")
-                        return response_data
-            else:
-                print(f"Successfully updated database scaling for DB {database_id}")
-                return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request exception: {e}")
-            raise Exception(f"Network error updating database scaling: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            raise
-    else:
-        # Only send the specific fields that need updating
-        # Don't include current config, just send the new values
-        url = f"{API_URL}/subscriptions/{subscription_id}/databases/{database_id}"
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "x-api-key": API_KEY,
-            "x-api-secret-key": API_SECRET
-        }
-        print(f"Updating database scaling: {url}")
-        print(f"Request body: {new_values}")
+        if response.status_code not in (200, 202):
+            print(f"API Error Response: {response.status_code} - {response.text}")
+            raise Exception(f"Failed to update database scaling: {response.status_code} {response.text}")
         
-        try:
-            response = requests.put(url, headers=headers, json=new_values)
-            print(f"API Response Status: {response.status_code}")
-            print(f"API Response Body: {response.text}")
-            
-            if response.status_code not in (200, 202):
-                print(f"API Error Response: {response.status_code} - {response.text}")
-                raise Exception(f"Failed to update database scaling: {response.status_code} {response.text}")
-            
-            # If it's a 202 response, check the task status
-            if response.status_code == 202:
-                response_data = response.json()
-                task_id = response_data.get('taskId')
-                if task_id:
-                    print(f"Task created: {task_id}")
-                    # Update tracking with task ID
-                    update_recent_action(database_id, new_values, task_id)
-                    # Wait a bit and check task status
-                    time.sleep(2)
-                    task_status = check_task_status(task_id)
-                    if task_status in ['completed', 'success']:
-                        print(f"Successfully updated database scaling for DB {database_id}")
-                        return response_data
-                    elif task_status in ['failed', 'error']:
-                        raise Exception(f"Task failed with status: {task_status}")
-                    else:
-                        print(f"Task status: {task_status} - will check again later")
-                        return response_data
-            else:
-                print(f"Successfully updated database scaling for DB {database_id}")
-                return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request exception: {e}")
-            raise Exception(f"Network error updating database scaling: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            raise
+        response_data = response.json()
+        # A 202 response means the change runs as a task; track it in the background
+        task_id = response_data.get('taskId') if response.status_code == 202 else None
+        if task_id:
+            print(f"Task created: {task_id}")
+            update_recent_action(database_id, new_values, task_id, subscription_id)
+            def on_complete(task):
+                _on_task_complete(task)
+                if on_task_complete is not None:
+                    on_task_complete(task)
+            task_tracker.track(task_id, subscription_id, database_id, new_values, on_complete=on_complete, on_poll=on_task_poll)
+        else:
+            update_recent_action(database_id, new_values, subscription_id=subscription_id)
+            print(f"Successfully updated database scaling for DB {database_id}")
+        return response_data
+        
+    except requests.exceptions.RequestException as e:
+        print(f"Request exception: {e}")
+        raise Exception(f"Network error updating database scaling: {e}")
 
 def set_autoscale_status(database_id, status):
-    _autoscale_status[database_id] = status
+    database_id = str(database_id)
+    previous = state.set_status(database_id, status)
+    if status != previous:
+        if status != 'in_progress':
+            instrumentation.AUTOSCALE_ACTIONS.labels(status).inc()
+        events.bus.publish('autoscale_status', {'database_id': database_id, 'status': status})
 
 def get_autoscale_status():
-    return _autoscale_status.copy()
+    return state.get_statuses()
 
 def are_all_databases_active(subscription_id, all_databases):
     """
@@ -351,13 +381,20 @@ def are_all_databases_active(subscription_id, all_databases):
     
     return True
 
-def autoscale_database(subscription_id, db, db_metrics, thresholds, max_scaling, all_databases=None):
+def autoscale_database(subscription_id, db, db_metrics, thresholds, max_scaling, all_databases=None,
+                       lease=None, on_task_complete=None, on_task_poll=None):
     """
     Main entry point: checks if autoscaling is needed and performs it if allowed.
     Ensures only one autoscale per subscription at a time.
     Only scales if all databases in the subscription are active.
+    lease: token of the subscription lease when the caller already holds it (a scale
+    plan); it is renewed here and left held, so keeping it alive until the change has
+    finished (e.g. from on_task_poll) and releasing it is up to the caller.
+    Returns False if nothing was scaled, the task ID if the change runs as a Cloud API
+    task (on_task_poll(task) is called after every poll of it and on_task_complete(task)
+    once it finishes), True otherwise.
     """
-    lock = _autoscale_locks.setdefault(subscription_id, threading.Lock())
+    lease_name = f"subscription:{subscription_id}"
     db_id = db.get('databaseId') or db.get('database_id')
     
     # Check if all databases in the subscription are active
@@ -370,7 +407,10 @@ def autoscale_database(subscription_id, db, db_metrics, thresholds, max_scaling,
     if db_status != 'active':
         print(f"DB {db_id} is not active (status: {db_status}), skipping autoscale.")
         return False
-    if not lock.acquire(blocking=False):
+    # Held across processes sharing the state backend; expires if this process dies mid-request
+    held = lease is not None
+    lease = state.acquire_lease(lease_name, throughput.AUTOSCALE_LOCK_LEASE_SECONDS, token=lease)
+    if lease is None:
         print(f"Autoscale already in progress for subscription {subscription_id}, skipping.")
         return False
     try:
@@ -385,21 +425,31 @@ def autoscale_database(subscription_id, db, db_metrics, thresholds, max_scaling,
             return False
             
         print(f"Autoscaling DB {db_id} with values: {new_values}")
-        update_database_scaling(subscription_id, db_id, new_values)
+        response_data = update_database_scaling(subscription_id, db_id, new_values, on_task_complete, on_task_poll)
         print(f"Autoscale performed for DB {db_id}")
+        # Tracked tasks report their own outcome once they finish
+        if response_data and response_data.get('taskId'):
+            return response_data['taskId']
         set_autoscale_status(db_id, 'done')
         return True
     finally:
-        lock.release()
+        if not held:
+            state.release_lease(lease_name, lease)
 
 def enable_autoscale(subscription_id, database_id):
-    _autoscale_enabled.add((str(subscription_id), str(database_id)))
+    subscription_id, database_id = str(subscription_id), str(database_id)
+    _record(lambda: state.enable(subscription_id, database_id),
+            {'op': 'enable', 'subscription_id': subscription_id, 'database_id': database_id})
+    events.bus.publish('autoscale_enabled', {'subscription_id': subscription_id, 'database_id': database_id, 'enabled': True})
 
 def disable_autoscale(subscription_id, database_id):
-    _autoscale_enabled.discard((str(subscription_id), str(database_id)))
+    subscription_id, database_id = str(subscription_id), str(database_id)
+    _record(lambda: state.disable(subscription_id, database_id),
+            {'op': 'disable', 'subscription_id': subscription_id, 'database_id': database_id})
+    events.bus.publish('autoscale_enabled', {'subscription_id': subscription_id, 'database_id': database_id, 'enabled': False})
 
 def is_autoscale_enabled(subscription_id, database_id):
-    return (str(subscription_id), str(database_id)) in _autoscale_enabled
+    return state.is_enabled(str(subscription_id), str(database_id))
 
 def get_all_autoscale_enabled():
-    return list(_autoscale_enabled) 
\ No newline at end of file
+    return state.list_enabled() 
\ No newline at end of file
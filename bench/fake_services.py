@@ -0,0 +1,260 @@
+"""
+Local stand-ins for the Redis Cloud API and Prometheus, for benchmarking without
+credentials. Run on its own to point a dashboard at it:
+
+    python bench/fake_services.py --databases 1000
+
+then set cloud_api_url, shard_types_api_url and prometheus_server_url in config.yaml
+to the printed URLs.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# (name, memory GB, ops/sec, hourly price) of the shard types offered in every region
+SHARD_TYPES = [
+    ('micro', 1, 1000, 0.02),
+    ('small', 4, 5000, 0.07),
+    ('medium', 12, 12500, 0.19),
+    ('large', 25, 25000, 0.36),
+]
+REGIONS = ['us-east-1', 'eu-west-1']
+CLOUDS = ['AWS', 'GCP']
+
+# Pricing list of every subscription; half of them embed it as subscriptionPricing
+PRICING = [{'type': 'Shards', 'quantity': shards, 'pricePerUnit': 0.09} for shards in range(1, 5)] + [
+    {'type': 'MinimumPrice', 'pricePerUnit': 0.05}
+]
+
+class FakeFleet:
+    """
+    A deterministic fleet of databases spread over subscriptions, and the metric values
+    Prometheus reports for them. hot_fraction of the databases run above the default
+    throughput and memory thresholds, so autoscaling has work to do.
+    """
+
+    def __init__(self, databases, databases_per_subscription=50, hot_fraction=0.05):
+        self.subscriptions = []
+        self.databases = {}  # {subscription_id: [database, ...]}
+        subscription_count = max(1, -(-databases // databases_per_subscription))
+        for index in range(subscription_count):
+            subscription_id = 1000 + index
+            self.subscriptions.append({
+                'id': subscription_id,
+                'name': f'bench-sub-{index}',
+                'cloudDetails': [{'provider': CLOUDS[index % len(CLOUDS)]}],
+                'subscriptionPricing': [] if index % 2 else PRICING,
+            })
+            self.databases[subscription_id] = []
+        for index in range(databases):
+            subscription = self.subscriptions[index % subscription_count]
+            subscription_id = subscription['id']
+            database_id = 10000 + index
+            shards = 1 + index % 4
+            self.databases[subscription_id].append({
+                'databaseId': database_id,
+                'name': f'bench-db-{index}',
+                'subscriptionId': subscription_id,
+                'status': 'active',
+                'region': REGIONS[index % len(REGIONS)],
+                'memoryLimitInGb': 2 * shards,
+                'throughputMeasurement': {'by': 'operations-per-second', 'value': 2500 * shards},
+                'privateEndpoint': f'redis-{database_id}.internal.c{subscription_id}.bench.local:12000',
+                'replication': index % 3 == 0,
+                'clustering': {'numberOfShards': shards},
+            })
+        self.hot = {db['databaseId'] for db in self.all_databases() if (db['databaseId'] * 2654435761) % 1000 < hot_fraction * 1000}
+        self.series = {(self.cluster_label(db), str(db['databaseId'])): db for db in self.all_databases()}
+        self._task_ids = itertools.count(1)
+
+    def all_databases(self):
+        for databases in self.databases.values():
+            yield from databases
+
+    def find_database(self, subscription_id, database_id):
+        for db in self.databases.get(subscription_id, []):
+            if db['databaseId'] == database_id:
+                return db
+        return None
+
+    @staticmethod
+    def cluster_label(db):
+        return db['privateEndpoint'].split('.internal.', 1)[1].split(':')[0]
+
+    def metric_value(self, metric, db):
+        utilisation = 0.92 if db['databaseId'] in self.hot else 0.25 + (db['databaseId'] % 7) * 0.05
+        ops = db['throughputMeasurement']['value'] * utilisation
+        if metric == 'bdb_used_memory':
+            return db['memoryLimitInGb'] * 1024 ** 3 * utilisation
+        if metric == 'bdb_shard_cpu_user_max':
+            return 10 + 40 * utilisation
+        if metric == 'bdb_avg_latency_max':
+            return 0.3 + utilisation
+        if metric in ('bdb_ingress_bytes_max', 'bdb_egress_bytes_max'):
+            return ops * 400
+        return ops
+
+    def next_task_id(self):
+        return f'bench-task-{next(self._task_ids)}'
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, fleet, latency_ms=0, error_rate=0.0, seed=0):
+        super().__init__(address, handler)
+        self.fleet = fleet
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def simulate(self):
+        """Count the request, wait the configured latency; returns True if it should fail"""
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.error_rate
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return fail
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_failure(self):
+        self.send_json({'error': 'simulated failure'}, 503)
+
+class FakeCloudAPIHandler(_Handler):
+    """Cloud API (/v1/...) and console shard type API (/api/v1/...)"""
+
+    def do_GET(self):
+        if self.server.simulate():
+            return self.send_failure()
+        fleet = self.server.fleet
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/v1/subscriptions':
+            return self.send_json({'subscriptions': [dict(sub) for sub in fleet.subscriptions]})
+        match = re.fullmatch(r'/v1/subscriptions/(\d+)/databases', url.path)
+        if match:
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', ['100'])[0])
+            databases = fleet.databases.get(int(match.group(1)), [])
+            return self.send_json({'subscription': [{'databases': databases[offset:offset + limit]}]})
+        match = re.fullmatch(r'/v1/subscriptions/(\d+)/databases/(\d+)', url.path)
+        if match:
+            db = fleet.find_database(int(match.group(1)), int(match.group(2)))
+            return self.send_json(db) if db else self.send_json({'error': 'not found'}, 404)
+        if re.fullmatch(r'/v1/subscriptions/(\d+)/pricing', url.path):
+            return self.send_json({'pricing': PRICING})
+        match = re.fullmatch(r'/v1/tasks/(.+)', url.path)
+        if match:
+            return self.send_json({'taskId': match.group(1), 'status': 'processing-completed'})
+        if url.path == '/api/v1/shardTypes':
+            return self.send_json({'shardTypes': [
+                {'id': index, 'name': name, 'memory_size_gb': memory_gb, 'throughput': ops}
+                for index, (name, memory_gb, ops, _) in enumerate(SHARD_TYPES, 1)
+            ]})
+        if url.path == '/api/v1/shardTypePricings':
+            return self.send_json({'shardTypePricings': [
+                {'shard_type_id': index, 'region_name': region, 'cloud_name': cloud, 'price': price}
+                for index, (_, _, _, price) in enumerate(SHARD_TYPES, 1)
+                for region in REGIONS for cloud in CLOUDS
+            ]})
+        self.send_json({'error': 'not found'}, 404)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.simulate():
+            return self.send_failure()
+        if not re.fullmatch(r'/v1/subscriptions/(\d+)/databases/(\d+)', urlparse(self.path).path):
+            return self.send_json({'error': 'not found'}, 404)
+        self.send_json({'taskId': self.server.fleet.next_task_id()}, 202)
+
+class FakePrometheusHandler(_Handler):
+    """Instant queries over synthetic bdb_* series, one per database"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/api/v1/query':
+            return self.send_json({'status': 'error', 'error': 'not found'}, 404)
+        if self.server.simulate():
+            return self.send_failure()
+        expr = parse_qs(url.query).get('query', [''])[0]
+        metric = re.search(r'bdb_\w+', expr)
+        selector = re.search(r'cluster="([^"]*)",bdb="([^"]*)"', expr)
+        series = self.server.fleet.series
+        if selector:
+            series = {selector.groups(): series[selector.groups()]} if selector.groups() in series else {}
+        result = []
+        if metric:
+            now = time.time()
+            for (cluster, bdb), db in series.items():
+                value = self.server.fleet.metric_value(metric.group(0), db)
+                result.append({'metric': {'cluster': cluster, 'bdb': bdb}, 'value': [now, str(value)]})
+        self.send_json({'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
+
+def start_fake_services(fleet, cloud_port=0, prometheus_port=0, host='127.0.0.1',
+                        cloud_latency_ms=0, cloud_error_rate=0.0,
+                        prometheus_latency_ms=0, prometheus_error_rate=0.0, seed=0):
+    """
+    Serve the fake Cloud API and Prometheus from background threads.
+    returns: (cloud server, prometheus server); their URLs follow from server_address
+    """
+    cloud = FakeServer((host, cloud_port), FakeCloudAPIHandler, fleet, cloud_latency_ms, cloud_error_rate, seed)
+    prometheus = FakeServer((host, prometheus_port), FakePrometheusHandler, fleet, prometheus_latency_ms, prometheus_error_rate, seed + 1)
+    for server in (cloud, prometheus):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return cloud, prometheus
+
+def add_fleet_arguments(parser):
+    parser.add_argument('--databases-per-subscription', type=int, default=50)
+    parser.add_argument('--hot-fraction', type=float, default=0.05, help='Share of databases above the scaling thresholds')
+    parser.add_argument('--cloud-latency-ms', type=float, default=20)
+    parser.add_argument('--cloud-error-rate', type=float, default=0.0)
+    parser.add_argument('--prometheus-latency-ms', type=float, default=5)
+    parser.add_argument('--prometheus-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--databases', type=int, default=100)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--cloud-port', type=int, default=0)
+    parser.add_argument('--prometheus-port', type=int, default=0)
+    add_fleet_arguments(parser)
+    args = parser.parse_args()
+    fleet = FakeFleet(args.databases, args.databases_per_subscription, args.hot_fraction)
+    cloud, prometheus = start_fake_services(
+        fleet, args.cloud_port, args.prometheus_port, args.host,
+        args.cloud_latency_ms, args.cloud_error_rate,
+        args.prometheus_latency_ms, args.prometheus_error_rate, args.seed
+    )
+    cloud_url = 'http://%s:%d' % cloud.server_address
+    print(f"cloud_api_url: {cloud_url}/v1", flush=True)
+    print(f"shard_types_api_url: {cloud_url}/api/v1", flush=True)
+    print('prometheus_server_url: http://%s:%d' % prometheus.server_address, flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Benchmark the metrics refresh, /api/metrics and the autoscale loop against the
+simulated Redis Cloud API and Prometheus in fake_services.py.
+
+    python bench/run.py                                  # 10, 100, 1000 and 5000 databases
+    python bench/run.py --sizes 100,1000 --output before.json
+    python bench/run.py --sizes 100,1000 --baseline before.json
+
+Every size runs in fresh processes (fake services and the measured app), so caches
+and peak RSS are per size. With --baseline the run exits with status 1 if a latency,
+query count or peak RSS grew by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+DEFAULT_SIZES = '10,100,1000,5000'
+
+# Results compared against a baseline, with the smallest change that counts as a regression
+# (timings in ms are noisy at small sizes)
+REGRESSION_CHECKS = {
+    'get_all_metrics_cold_ms': 20,
+    'get_all_metrics_warm_ms': 10,
+    'get_all_metrics_prometheus_queries': 0,
+    'get_all_metrics_cloud_requests': 0,
+    'api_refresh_ms': 10,
+    'api_snapshot_ms': 2,
+    'api_compact_ms': 2,
+    'autoscale_evaluate_ms': 5,
+    'peak_rss_mb': 5,
+}
+
+# Columns of the printed summary: (result key, header)
+SUMMARY_COLUMNS = [
+    ('databases', 'dbs'),
+    ('get_all_metrics_cold_ms', 'cold ms'),
+    ('get_all_metrics_warm_ms', 'warm ms'),
+    ('get_all_metrics_prometheus_queries', 'prom q'),
+    ('get_all_metrics_cloud_requests', 'cloud req'),
+    ('api_refresh_ms', 'api refresh ms'),
+    ('api_snapshot_ms', 'api snapshot ms'),
+    ('api_compact_ms', 'compact ms'),
+    ('autoscale_evaluate_ms', 'autoscale ms'),
+    ('autoscale_actions', 'actions'),
+    ('peak_rss_mb', 'peak RSS MB'),
+]
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def _counter_total(counter):
+    """Sum of all label combinations of a prometheus_client Counter"""
+    return sum(sample.value for metric in counter.collect() for sample in metric.samples if sample.name.endswith('_total'))
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_worker(args):
+    """Measure one fleet size; runs in the temporary directory holding the bench config.yaml"""
+    sys.path.insert(0, REPO_ROOT)
+    import throughput
+    import instrumentation
+
+    def counts():
+        return _counter_total(instrumentation.PROMETHEUS_QUERIES), _counter_total(instrumentation.CLOUD_API_REQUESTS)
+
+    result = {'databases': args.databases}
+
+    # get_all_metrics: the first call also loads the inventory, shard types and pricing
+    prom_before, cloud_before = counts()
+    start = time.perf_counter()
+    data = throughput.get_all_metrics(period='5m')
+    result['get_all_metrics_cold_ms'] = _elapsed_ms(start)
+    prom_after, cloud_after = counts()
+    result['get_all_metrics_cloud_requests'] = int(cloud_after - cloud_before)
+    result['rows'] = len(data['databases'])
+    warm = []
+    for _ in range(args.iterations):
+        prom_before, _ = counts()
+        start = time.perf_counter()
+        throughput.get_all_metrics(period='5m')
+        warm.append(_elapsed_ms(start))
+        prom_after, _ = counts()
+    result['get_all_metrics_warm_ms'] = round(statistics.median(warm), 2)
+    result['get_all_metrics_prometheus_queries'] = int(prom_after - prom_before)
+
+    # /api/metrics end to end: importing app starts the collector, the first request waits for it
+    import app
+    import autoscale_engine
+    import autoscaling
+    client = app.app.test_client()
+    client.get('/api/metrics?period=5m')
+    refresh, snapshot, compact = [], [], []
+    for _ in range(args.iterations):
+        app.metrics_collector.invalidate()
+        start = time.perf_counter()
+        response = client.get('/api/metrics?period=5m')
+        refresh.append(_elapsed_ms(start))
+        start = time.perf_counter()
+        response = client.get('/api/metrics?period=5m')
+        snapshot.append(_elapsed_ms(start))
+        result['api_bytes'] = len(response.data)
+        start = time.perf_counter()
+        response = client.get('/api/metrics?period=5m&format=compact')
+        compact.append(_elapsed_ms(start))
+        result['api_compact_bytes'] = len(response.data)
+    result['api_refresh_ms'] = round(statistics.median(refresh), 2)
+    result['api_snapshot_ms'] = round(statistics.median(snapshot), 2)
+    result['api_compact_ms'] = round(statistics.median(compact), 2)
+
+    # Autoscale loop: every database enabled, evaluated once by a dedicated engine
+    app.autoscaler.stop()
+    databases = app.metrics_collector.get_snapshot().data['databases']
+    for db in databases:
+        autoscaling.enable_autoscale(db.get('subscription_id'), db.get('database_id'))
+    engine = autoscale_engine.AutoscaleEngine(app.metrics_collector, 86400, max_workers=throughput.AUTOSCALE_MAX_WORKERS)
+    _, cloud_before = counts()
+    start = time.perf_counter()
+    result['autoscale_actions'] = engine.run_once()
+    result['autoscale_evaluate_ms'] = _elapsed_ms(start)
+    deadline = time.time() + args.timeout
+    while engine.get_status()['in_flight'] and time.time() < deadline:
+        time.sleep(0.01)
+    result['autoscale_dispatch_ms'] = _elapsed_ms(start)
+    _, cloud_after = counts()
+    result['autoscale_cloud_requests'] = int(cloud_after - cloud_before)
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    with open(args.result_file, 'w') as f:
+        json.dump(result, f)
+
+def _start_fake_services(args, databases):
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, 'fake_services.py'),
+        '--databases', str(databases),
+        '--databases-per-subscription', str(args.databases_per_subscription),
+        '--hot-fraction', str(args.hot_fraction),
+        '--cloud-latency-ms', str(args.cloud_latency_ms),
+        '--cloud-error-rate', str(args.cloud_error_rate),
+        '--prometheus-latency-ms', str(args.prometheus_latency_ms),
+        '--prometheus-error-rate', str(args.prometheus_error_rate),
+        '--seed', str(args.seed),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # fake_services prints its URLs as config.yaml lines once it is listening
+    settings = {}
+    for _ in range(3):
+        key, value = process.stdout.readline().strip().split(': ', 1)
+        settings[key] = value
+    return process, settings
+
+def run_size(args, databases):
+    fake, settings = _start_fake_services(args, databases)
+    try:
+        with tempfile.TemporaryDirectory(prefix='redis-health-bench-') as workdir:
+            settings.update({
+                'prometheus_vectorized_queries': not args.per_database_queries,
+                # Only the measured calls refresh; the background loops stay idle
+                'prometheus_query_interval_seconds': 86400,
+                'autoscale_interval_seconds': 86400,
+            })
+            with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+                json.dump(settings, f)  # JSON is valid YAML
+            result_file = os.path.join(workdir, 'result.json')
+            command = [
+                sys.executable, os.path.abspath(__file__), '--worker',
+                '--databases', str(databases),
+                '--iterations', str(args.iterations),
+                '--timeout', str(args.timeout),
+                '--result-file', result_file,
+            ]
+            output = None if args.verbose else subprocess.DEVNULL
+            subprocess.run(command, cwd=workdir, stdout=output, check=True, timeout=args.timeout * 4)
+            with open(result_file) as f:
+                return json.load(f)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+def find_regressions(results, baseline, tolerance):
+    """returns: list of (databases, key, baseline value, current value)"""
+    baseline_by_size = {entry['databases']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        previous = baseline_by_size.get(entry['databases'])
+        if previous is None:
+            continue
+        for key, min_delta in REGRESSION_CHECKS.items():
+            if key not in entry or key not in previous:
+                continue
+            if entry[key] > previous[key] * (1 + tolerance) and entry[key] - previous[key] > min_delta:
+                regressions.append((entry['databases'], key, previous[key], entry[key]))
+    return regressions
+
+def print_summary(results):
+    rows = [[header for _, header in SUMMARY_COLUMNS]]
+    rows += [[str(entry.get(key, '')) for key, _ in SUMMARY_COLUMNS] for entry in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(SUMMARY_COLUMNS))]
+    for row in rows:
+        print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated fleet sizes (databases)')
+    parser.add_argument('--iterations', type=int, default=3, help='Measured runs per warm timing')
+    parser.add_argument('--per-database-queries', action='store_true', help='Benchmark with prometheus_vectorized_queries off')
+    parser.add_argument('--timeout', type=float, default=300, help='Seconds to wait for scale actions to be dispatched')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative growth over the baseline')
+    parser.add_argument('--verbose', action='store_true', help="Show the measured app's output")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--databases', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    sys.path.insert(0, BENCH_DIR)
+    from fake_services import add_fleet_arguments
+    add_fleet_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    results = []
+    for databases in [int(size) for size in args.sizes.split(',')]:
+        print(f"Benchmarking {databases} databases...", flush=True)
+        results.append(run_size(args, databases))
+    print_summary(results)
+
+    report = {'created_at': time.time(), 'settings': {key: value for key, value in vars(args).items() if key not in ('worker', 'databases', 'result_file')}, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for databases, key, previous, current in regressions:
+            print(f"REGRESSION {databases} databases: {key} {previous} -> {current}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == '__main__':
+    main()
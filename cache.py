@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Every cache created, for stats reporting
+_caches = []
+_caches_lock = threading.Lock()
+
+class _Entry:
+    __slots__ = ('value', 'stored_at', 'expires_at')
+
+    def __init__(self, value, stored_at, expires_at):
+        self.value = value
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+
+class _Flight:
+    """One in-progress load that concurrent callers of the same key wait on"""
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+class TTLCache:
+    """
+    Thread-safe cache with per-entry expiry and LRU eviction at maxsize.
+    get_or_load() is single-flight: concurrent misses for one key run the loader once
+    and every caller gets its result (or its exception).
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # {key: _Entry}, least recently used first
+        self._loading = {}  # {key: _Flight}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'coalesced': 0, 'evictions': 0}
+        with _caches_lock:
+            _caches.append(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return default
+            self._counters['hits'] += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def peek(self, key, default=None):
+        """Return an unexpired value without counting a hit or refreshing its LRU position."""
+        with self._lock:
+            entry = self._live_entry(key)
+            return default if entry is None else entry.value
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = _Entry(value, now, now + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get_or_load(self, key, loader, ttl=None, max_age=None):
+        """
+        Return the cached value for key, calling loader() to fill it on a miss.
+        max_age (seconds) treats older entries as misses without expiring them, so
+        the loader can still peek() at the previous value.
+        """
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is not None and (max_age is None or time.time() - entry.stored_at < max_age):
+                self._counters['hits'] += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            flight = self._loading.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._loading[key] = flight
+                self._counters['misses'] += 1
+            else:
+                self._counters['coalesced'] += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, ttl)
+            with self._lock:
+                self._counters['loads'] += 1
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._counters['load_errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            flight.event.set()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, name=self.name, size=len(self._entries), maxsize=self.maxsize)
+
+    def _live_entry(self, key):
+        """Return the entry for key, dropping it if it has expired. Caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None and entry.expires_at <= time.time():
+            del self._entries[key]
+            self._counters['evictions'] += 1
+            return None
+        return entry
+
+def all_cache_stats():
+    """Stats of every TTLCache in the process"""
+    with _caches_lock:
+        caches = list(_caches)
+    return [cache.stats() for cache in caches]
@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from contextlib import nullcontext
+
+import instrumentation
+import records
+import throughput
+import tracing
+
+# The period the dashboard selects by default; it is always kept fresh
+DEFAULT_PERIOD = '5m'
+
+# Stop refreshing a non-default period once nobody has asked for it for this many intervals
+IDLE_PERIOD_INTERVALS = 5
+
+# Deltas can be served to clients at most this many snapshots of a period behind
+DELTA_MAX_GENERATIONS = 100
+
+# An immutable, already-serialized result of one get_all_metrics() run, in the full
+# and the compact (columnar) wire format. token is the generation as clients see it.
+Snapshot = namedtuple('Snapshot', ['generation', 'period', 'collected_at', 'data', 'body', 'compact_body', 'token'])
+
+class MetricsCollector:
+    """
+    Refreshes get_all_metrics() in a background thread and publishes the result as
+    a Snapshot, so any number of dashboard clients share a single Prometheus fan-out.
+    """
+
+    def __init__(self, interval_seconds, default_period=DEFAULT_PERIOD):
+        self.interval_seconds = interval_seconds
+        self.default_period = default_period
+        self._snapshots = {}  # {period: Snapshot}
+        self._last_requested = {default_period: time.time()}  # {period: timestamp}
+        self._generation = 0
+        # Generation numbers restart with every process, so the tokens handed to clients
+        # carry this collector's id: a token from another worker or an earlier process
+        # is never mistaken for one of ours
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._refresh_locks = {}  # {period: threading.Lock}, one refresh per period at a time
+        self._row_versions = {}  # {period: _RowVersions}
+        self._traces = {}  # {period: tracing.Trace} of the last refresh, with tracing_enabled
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def add_listener(self, callback):
+        """Call callback(snapshot) after every new snapshot is published."""
+        self._listeners.append(callback)
+
+    def get_snapshot(self, period=None):
+        """
+        Return the latest snapshot for a period. Only the first request for a period
+        that has never been collected waits for a refresh.
+        """
+        period = period or self.default_period
+        with self._lock:
+            self._last_requested[period] = time.time()
+            snapshot = self._snapshots.get(period)
+        if snapshot is None:
+            snapshot = self.refresh(period)
+        return snapshot
+
+    def latest(self, period):
+        """The current snapshot of a period without refreshing or marking it requested, or None."""
+        with self._lock:
+            return self._snapshots.get(period)
+
+    def last_trace(self, period=None):
+        """Trace of the last refresh of a period, or None if tracing_enabled is off."""
+        with self._lock:
+            return self._traces.get(period or self.default_period)
+
+    def invalidate(self):
+        """Drop all snapshots so the next read collects fresh data."""
+        with self._lock:
+            self._snapshots.clear()
+            self._row_versions.clear()
+
+    def generation_token(self, generation):
+        """The '<instance_id>:<generation>' token clients see for a generation"""
+        return f"{self.instance_id}:{generation}"
+
+    def parse_generation_token(self, token):
+        """Generation number of a token issued by this collector, or None"""
+        instance_id, _, generation = str(token).rpartition(':')
+        if instance_id != self.instance_id or not generation.isdigit():
+            return None
+        return int(generation)
+
+    def previous_generation(self, snapshot):
+        """Generation token of the snapshot of the same period published just before this one, if known."""
+        with self._lock:
+            versions = self._row_versions.get(snapshot.period)
+            if versions is None or len(versions.generations) < 2 or versions.generations[-1] != snapshot.generation:
+                return None
+            return self.generation_token(versions.generations[-2])
+
+    def get_delta(self, snapshot, since):
+        """
+        Databases of snapshot that changed after the generation token `since`, and the
+        keys ('<subscription_id>_<database_id>') of those removed since then.
+        returns: (changed records, removed keys), or None if `since` is too old, was
+        issued by another collector or is unknown and the client needs the full snapshot
+        """
+        since = self.parse_generation_token(since)
+        if since is None:
+            return None
+        with self._lock:
+            versions = self._row_versions.get(snapshot.period)
+            if versions is None or not versions.generations or versions.generations[-1] != snapshot.generation:
+                return None
+            if since < versions.generations[0] or since > snapshot.generation:
+                return None
+            changed = [db for db in snapshot.data["databases"] if versions.rows[row_key(db)][1] > since]
+            removed = [key for key, generation in versions.removed.items() if generation > since]
+        return changed, removed
+
+    def refresh(self, period):
+        """Collect metrics for a period now and publish a new snapshot."""
+        with self._lock:
+            refresh_lock = self._refresh_locks.setdefault(period, threading.Lock())
+            generation_before = self._snapshots[period].generation if period in self._snapshots else None
+        with refresh_lock:
+            with self._lock:
+                current = self._snapshots.get(period)
+            # Another caller finished a refresh while we waited for the lock
+            if current is not None and current.generation != generation_before:
+                return current
+            with (tracing.start_trace('refresh') if throughput.TRACING_ENABLED else nullcontext()) as trace:
+                try:
+                    with instrumentation.Timer(instrumentation.REFRESH_DURATION.labels(period)):
+                        data = throughput.get_all_metrics(period=period)
+                except Exception:
+                    instrumentation.REFRESH_ERRORS.labels(period).inc()
+                    raise
+                collected_at = time.time()
+                with self._lock:
+                    self._generation += 1
+                    generation = self._generation
+                token = self.generation_token(generation)
+                extra = {'generation': token, 'period': period, 'collected_at': collected_at}
+                with tracing.span('serialize'):
+                    snapshot = Snapshot(
+                        generation, period, collected_at, data,
+                        encode_body(data, **extra),
+                        encode_body(data, compact=True, **extra),
+                        token
+                    )
+                    fingerprints = {row_key(db): hash(json.dumps(db, default=records.to_json, sort_keys=True)) for db in data["databases"]}
+            with self._lock:
+                if trace is not None:
+                    self._traces[period] = trace
+                self._snapshots[period] = snapshot
+                self._row_versions.setdefault(period, _RowVersions()).update(generation, fingerprints)
+            for callback in self._listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    print(f"Snapshot listener failed: {e}")
+            return snapshot
+
+    def _active_periods(self):
+        now = time.time()
+        idle_after = IDLE_PERIOD_INTERVALS * self.interval_seconds
+        with self._lock:
+            for period, last in list(self._last_requested.items()):
+                if period != self.default_period and now - last > idle_after:
+                    del self._last_requested[period]
+                    self._snapshots.pop(period, None)
+                    self._row_versions.pop(period, None)
+                    self._traces.pop(period, None)
+            return list(self._last_requested)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            for period in self._active_periods():
+                try:
+                    self.refresh(period)
+                except Exception as e:
+                    print(f"Metrics collection failed for period {period}: {e}")
+            self._stop.wait(max(0, self.interval_seconds - (time.time() - started)))
+
+class _RowVersions:
+    """Generation at which each database row of one period last changed"""
+
+    def __init__(self):
+        self.generations = deque(maxlen=DELTA_MAX_GENERATIONS)  # recent snapshot generations, oldest first
+        self.rows = {}  # {row key: (fingerprint, generation changed)}
+        self.removed = {}  # {row key: generation removed}
+
+    def update(self, generation, fingerprints):
+        self.generations.append(generation)
+        for key, fingerprint in fingerprints.items():
+            previous = self.rows.get(key)
+            if previous is None or previous[0] != fingerprint:
+                self.rows[key] = (fingerprint, generation)
+            self.removed.pop(key, None)
+        for key in [key for key in self.rows if key not in fingerprints]:
+            del self.rows[key]
+            self.removed[key] = generation
+        # Clients older than the oldest kept generation get a full snapshot, so older removals are not needed
+        oldest = self.generations[0]
+        for key in [key for key, removed_at in self.removed.items() if removed_at <= oldest]:
+            del self.removed[key]
+
+def row_key(db):
+    return f"{db.get('subscription_id')}_{db.get('database_id')}"
+
+def encode_body(data, compact=False, **extra):
+    """
+    Serialize a get_all_metrics() result. In the compact format `databases` is the
+    columnar records.encode_compact() form instead of a list of objects.
+    """
+    if compact:
+        data = dict(data, databases=records.encode_compact(data["databases"]))
+    return json.dumps(dict(data, **extra), default=records.to_json)
+
+def snapshot_response_body(snapshot, compact=False, delta=None, since=None):
+    """
+    Prefix the pre-encoded snapshot body with its current age. With a get_delta()
+    result, only the changed databases and the removed keys are encoded.
+    """
+    age = time.time() - snapshot.collected_at
+    if delta is not None:
+        changed, removed = delta
+        data = dict(snapshot.data, databases=changed)
+        body = encode_body(
+            data, compact, generation=snapshot.token, period=snapshot.period,
+            collected_at=snapshot.collected_at, delta=True, since=since, removed=removed
+        )
+    else:
+        body = snapshot.compact_body if compact else snapshot.body
+    return '{"age_seconds": %.3f, ' % age + body[1:]
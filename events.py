@@ -0,0 +1,70 @@
+import itertools
+import json
+import queue
+import threading
+
+# Events a subscriber may fall behind by before it is dropped (it reconnects and resyncs)
+SUBSCRIBER_QUEUE_SIZE = 256
+
+class EventBus:
+    """
+    In-process publish/subscribe for live dashboard updates. Every subscriber has its
+    own bounded queue; publishing never blocks, and a subscriber that stops reading
+    is disconnected instead of holding events for everyone.
+    """
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = Subscription(self, queue.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type, data):
+        """Send an event to every subscriber. data must be JSON-serializable, or already a JSON string."""
+        payload = data if isinstance(data, str) else json.dumps(data)
+        event = (next(self._ids), event_type, payload)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                subscriber.overflowed = True
+                self.unsubscribe(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+class Subscription:
+    def __init__(self, bus, event_queue):
+        self.bus = bus
+        self.queue = event_queue
+        self.overflowed = False
+
+    def get(self, timeout=None):
+        """Next (id, event_type, payload) event, or None if none arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+def format_sse(event_id, event_type, payload):
+    """Encode one event in the text/event-stream format"""
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+# Process-wide bus the dashboard stream reads from
+bus = EventBus()
@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+
+# (history metric, metrics_autoscale limit field, threshold) of the usage that is forecast
+FORECAST_METRICS = (
+    ('throughput', 'throughput_limit', 'throughput_threshold'),
+    ('memory', 'memory_limit_bytes', 'memory_threshold'),
+)
+
+def fit_linear_trends(timestamps, values, min_samples=5):
+    """
+    Least-squares line through every row of values at once; NaN marks a missing sample.
+    returns: (level at the last timestamp, slope per second) arrays, NaN for rows with
+    fewer than min_samples samples or no time spread
+    """
+    present = ~np.isnan(values)
+    counts = present.sum(axis=1)
+    # Time relative to the latest row, so the intercept is the current level
+    t = np.where(present, timestamps - timestamps[-1], 0.0)
+    y = np.where(present, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = t.sum(axis=1) / counts
+        y_mean = y.sum(axis=1) / counts
+        dt = np.where(present, t - t_mean[:, None], 0.0)
+        dy = np.where(present, y - y_mean[:, None], 0.0)
+        slope = (dt * dy).sum(axis=1) / (dt * dt).sum(axis=1)
+        level = y_mean - slope * t_mean
+    unusable = (counts < min_samples) | ~np.isfinite(slope)
+    slope[unusable] = np.nan
+    level[unusable] = np.nan
+    return level, slope
+
+def seconds_until(level, slope, limit):
+    """Seconds until each trend reaches its limit: 0 if it already has, inf if it never will"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        eta = np.where(slope > 0, (limit - level) / slope, np.inf)
+    return np.where(level >= limit, 0.0, eta)
+
+def forecast_scaling(history_store, entries, horizon_seconds, lookback_seconds, min_samples=5):
+    """
+    Fit a linear trend to the recent throughput and memory samples of every database
+    and find those projected to cross their scaling threshold within horizon_seconds.
+    entries: database records (with metrics_autoscale and thresholds) to forecast
+    returns: {db_key: {'metrics': metrics_autoscale with the usage projected at the
+    horizon, 'forecast': {metric: {'projected', 'slope_per_second', 'crossing_in_seconds'}}}}
+    """
+    if not entries:
+        return {}
+    db_keys = [f"{entry.get('subscription_id')}_{entry.get('database_id')}" for entry in entries]
+    now = time.time()
+    results = {}
+    for metric, limit_field, threshold in FORECAST_METRICS:
+        timestamps, values = history_store.window(metric, now - lookback_seconds, db_keys)
+        if len(timestamps) < min_samples:
+            continue
+        level, slope = fit_linear_trends(timestamps, values, min_samples)
+        limits = np.array([
+            (entry['metrics_autoscale'].get(limit_field) or 0) * entry.get('thresholds', {}).get(threshold, 1)
+            for entry in entries
+        ], dtype=np.float64)
+        # The latest sample may be a little old; count the horizon from now
+        age = now - timestamps[-1]
+        eta = seconds_until(level, slope, limits) - age
+        for i in np.nonzero((limits > 0) & np.isfinite(slope) & (eta <= horizon_seconds))[0]:
+            projected = float(level[i] + slope[i] * (age + horizon_seconds))
+            result = results.setdefault(db_keys[i], {'metrics': dict(entries[i]['metrics_autoscale'].items()), 'forecast': {}})
+            result['metrics'][metric] = max(result['metrics'].get(metric) or 0, projected)
+            result['forecast'][metric] = {
+                'projected': projected,
+                'slope_per_second': float(slope[i]),
+                'crossing_in_seconds': max(0.0, float(eta[i]))
+            }
+    return results
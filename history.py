@@ -0,0 +1,192 @@
+import math
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+# metrics_autoscale fields recorded for every database
+HISTORY_METRICS = ('throughput', 'memory', 'cpu', 'latency_ms', 'payload_size_bytes')
+
+_DURATION = re.compile(r'(\d+)(ms|s|m|h|d|w|y)')
+_DURATION_SECONDS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'y': 31536000}
+
+def parse_duration(value):
+    """Parse a Prometheus-style duration ('90s', '5m', '1h30m', '2d') into seconds."""
+    value = str(value).strip()
+    matches = list(_DURATION.finditer(value))
+    if not matches or ''.join(m.group(0) for m in matches) != value:
+        raise ValueError(f"Invalid duration: {value!r}")
+    return sum(int(m.group(1)) * _DURATION_SECONDS[m.group(2)] for m in matches)
+
+class HistoryStore:
+    """
+    Fixed-size in-memory history of per-database samples.
+
+    Rows are kept in a ring of `capacity` slots, one every `resolution_seconds`
+    (samples arriving sooner are folded into the current row by max, so peaks are
+    kept). Each (database, metric) series is a float32 array aligned to that ring,
+    so memory is bounded by capacity * max_series * 4 bytes.
+
+    Series not written for the longest time are evicted beyond max_series, but never
+    one written in the current round. With max_series None the bound follows the
+    fleet: the most series one round has written (databases * len(HISTORY_METRICS)).
+    """
+
+    def __init__(self, retention_seconds=86400, resolution_seconds=60, max_series=None):
+        self.retention_seconds = retention_seconds
+        self.resolution_seconds = resolution_seconds
+        self.max_series = max_series
+        self.rounds_over_cap = 0  # Rounds that wrote more series than max_series
+        self._warned_series = 0
+        self._peak_written = 0  # Most series written in one round
+        self.capacity = max(1, int(math.ceil(retention_seconds / resolution_seconds)))
+        self._times = array('d', [0.0]) * self.capacity
+        self._head = 0  # next slot to write
+        self._count = 0
+        self._series = OrderedDict()  # {(db_key, metric): array('f')}, least recently written first
+        self._lock = threading.Lock()
+
+    def record(self, samples, timestamp=None):
+        """
+        Record one round of samples.
+        samples: dict of {db_key: {metric: value or None}}
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            last = self._slot(self._count - 1) if self._count else None
+            if last is not None and timestamp - self._times[last] < self.resolution_seconds:
+                slot = last
+            else:
+                slot = self._head
+                self._times[slot] = timestamp
+                self._head = (self._head + 1) % self.capacity
+                self._count = min(self._count + 1, self.capacity)
+                for values in self._series.values():
+                    values[slot] = math.nan
+            written = 0
+            for db_key, metrics in samples.items():
+                for metric, value in metrics.items():
+                    if value is None:
+                        continue
+                    values = self._get_series(db_key, metric)
+                    current = values[slot]
+                    values[slot] = value if math.isnan(current) else max(current, value)
+                    written += 1
+            self._evict(written)
+
+    def record_snapshot(self, snapshot):
+        """Record the metrics_autoscale values of every database in a collector snapshot."""
+        samples = {}
+        for entry in snapshot.data.get("databases", []):
+            metrics = entry.get('metrics_autoscale')
+            if not metrics:
+                continue
+            db_key = f"{entry.get('subscription_id')}_{entry.get('database_id')}"
+            samples[db_key] = {metric: metrics.get(metric) for metric in HISTORY_METRICS}
+        self.record(samples, snapshot.collected_at)
+
+    def query(self, db_key, metric, start, end, step=None):
+        """
+        Return the samples of one series between start and end (epoch seconds).
+        With step, samples are downsampled to one point per step bucket, keeping the max.
+        returns: {'peak': float or None, 'series': [[timestamp, value], ...]}
+        """
+        with self._lock:
+            values = self._series.get((db_key, metric))
+            if values is None:
+                return {'peak': None, 'series': []}
+            first = self._first_index_at_or_after(start)
+            points = []
+            for i in range(first, self._count):
+                slot = self._slot(i)
+                ts = self._times[slot]
+                if ts > end:
+                    break
+                value = values[slot]
+                if not math.isnan(value):
+                    points.append([ts, value])
+        peak = max((value for _, value in points), default=None)
+        if step:
+            buckets = OrderedDict()
+            for ts, value in points:
+                bucket = start + ((ts - start) // step) * step
+                buckets[bucket] = max(buckets.get(bucket, value), value)
+            points = [[ts, value] for ts, value in buckets.items()]
+        return {'peak': peak, 'series': points}
+
+    def window(self, metric, since, db_keys):
+        """
+        Samples of one metric for many databases since a time, as arrays aligned on the
+        shared row timestamps (oldest first), for vectorized analysis.
+        returns: (timestamps of shape (rows,), values of shape (len(db_keys), rows) with
+        NaN where a database has no sample)
+        """
+        with self._lock:
+            first = self._first_index_at_or_after(since)
+            slots = np.array([self._slot(i) for i in range(first, self._count)], dtype=np.intp)
+            timestamps = np.frombuffer(self._times, dtype=np.float64)[slots]
+            values = np.full((len(db_keys), len(slots)), np.nan)
+            for row, db_key in enumerate(db_keys):
+                series = self._series.get((db_key, metric))
+                if series is not None:
+                    values[row] = np.frombuffer(series, dtype=np.float32)[slots]
+        return timestamps, values
+
+    def peak(self, db_key, metric, seconds):
+        """Highest value of a series over the last `seconds`."""
+        now = time.time()
+        return self.query(db_key, metric, now - seconds, now)['peak']
+
+    def stats(self):
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'max_series': self.max_series,
+                'rounds_over_cap': self.rounds_over_cap,
+                'rows': self._count,
+                'capacity': self.capacity,
+                'resolution_seconds': self.resolution_seconds,
+                'oldest': self._times[self._slot(0)] if self._count else None,
+                'bytes': self.capacity * (len(self._series) * 4 + 8),
+            }
+
+    def _slot(self, index):
+        """Ring slot of the index-th row, oldest first"""
+        return (self._head - self._count + index) % self.capacity
+
+    def _first_index_at_or_after(self, timestamp):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[self._slot(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _get_series(self, db_key, metric):
+        key = (db_key, metric)
+        values = self._series.get(key)
+        if values is None:
+            values = array('f', [math.nan]) * self.capacity
+            self._series[key] = values
+        else:
+            self._series.move_to_end(key)
+        return values
+
+    def _evict(self, written):
+        """Drop the least recently written series beyond the cap; the last `written` were written this round"""
+        self._peak_written = max(self._peak_written, written)
+        limit = self._peak_written if self.max_series is None else self.max_series
+        if written > limit:
+            self.rounds_over_cap += 1
+            if written > self._warned_series:
+                self._warned_series = written
+                print(f"History: {written} series written per round exceed history_max_series ({self.max_series}); "
+                      f"keeping them all. Raise history_max_series or leave it unset to size it from the fleet.")
+            limit = written
+        while len(self._series) > limit:
+            self._series.popitem(last=False)
@@ -0,0 +1,114 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+import cache
+import tracing
+
+# Refreshes can take up to the Prometheus refresh deadline (60s by default)
+_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REFRESH_DURATION = Histogram(
+    'redis_health_refresh_duration_seconds',
+    'Time to collect one metrics snapshot (get_all_metrics)',
+    ['period'], buckets=_DURATION_BUCKETS
+)
+REFRESH_ERRORS = Counter(
+    'redis_health_refresh_errors_total',
+    'Snapshot collections that raised an error',
+    ['period']
+)
+PHASE_DURATION = Histogram(
+    'redis_health_phase_duration_seconds',
+    'Time spent per refresh phase: inventory, prometheus, pricing, processing, autoscale',
+    ['phase'], buckets=_DURATION_BUCKETS
+)
+PROMETHEUS_QUERY_DURATION = Histogram(
+    'redis_health_prometheus_query_duration_seconds',
+    'Duration of single Prometheus instant queries'
+)
+PROMETHEUS_QUERIES = Counter(
+    'redis_health_prometheus_queries_total',
+    'Prometheus instant queries by result: ok, error (failed or non-success status) or timeout (cancelled at the refresh deadline)',
+    ['result']
+)
+CLOUD_API_DURATION = Histogram(
+    'redis_health_cloud_api_request_duration_seconds',
+    'Duration of Redis Cloud API requests',
+    ['endpoint']
+)
+CLOUD_API_REQUESTS = Counter(
+    'redis_health_cloud_api_requests_total',
+    'Redis Cloud API requests by endpoint and HTTP status ("error" if no response was received)',
+    ['endpoint', 'status']
+)
+AUTOSCALE_ACTIONS = Counter(
+    'redis_health_autoscale_actions_total',
+    'Autoscale actions by outcome: submitted by the engine, then done, failed or timeout',
+    ['outcome']
+)
+
+SNAPSHOT_AGE = Gauge(
+    'redis_health_snapshot_age_seconds',
+    'Seconds since the default-period snapshot was collected, to alert on collection stalling'
+)
+
+class Timer:
+    """
+    Context manager observing the elapsed seconds into a histogram (or one of its label
+    children). Given a span name, the block is also recorded as a span of the active trace.
+    """
+
+    def __init__(self, histogram, span=None):
+        self.histogram = histogram
+        self.span = span
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._active = tracing.begin(self.span) if self.span else None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        if self._active is not None:
+            self._active.end()
+        self.histogram.observe(self.elapsed)
+        return False
+
+def phase_timer(phase):
+    return Timer(PHASE_DURATION.labels(phase), span=phase)
+
+def cloud_api_request(endpoint, send, *args, **kwargs):
+    """Call send(*args, **kwargs) (e.g. requests.get) and record its duration and status."""
+    start = time.perf_counter()
+    active = tracing.begin(f'cloud_api:{endpoint}', url=args[0] if args else None)
+    try:
+        response = send(*args, **kwargs)
+    except Exception:
+        CLOUD_API_REQUESTS.labels(endpoint, 'error').inc()
+        raise
+    finally:
+        active.end()
+        CLOUD_API_DURATION.labels(endpoint).observe(time.perf_counter() - start)
+    CLOUD_API_REQUESTS.labels(endpoint, str(response.status_code)).inc()
+    return response
+
+class _CacheCollector:
+    """Exports the counters of every cache.TTLCache"""
+
+    def collect(self):
+        counters = {
+            name: CounterMetricFamily(f'redis_health_cache_{name}', f'Cache {name.replace("_", " ")}', labels=['cache'])
+            for name in ('hits', 'misses', 'loads', 'load_errors', 'coalesced', 'evictions')
+        }
+        size = GaugeMetricFamily('redis_health_cache_entries', 'Entries currently held per cache', labels=['cache'])
+        for stats in cache.all_cache_stats():
+            for name, family in counters.items():
+                family.add_metric([stats['name']], stats[name])
+            size.add_metric([stats['name']], stats['size'])
+        yield from counters.values()
+        yield size
+
+REGISTRY.register(_CacheCollector())
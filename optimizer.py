@@ -0,0 +1,72 @@
+import numpy as np
+
+# Upper bound on the units of the first shard type tried inside a two-type mix
+MAX_MIX_UNITS = 64
+
+class ShardCatalog:
+    """Shard types sold in one region/cloud, as parallel NumPy arrays."""
+
+    def __init__(self, shard_types):
+        """shard_types: list of (name, memory_mb, throughput_ops, price_per_unit)"""
+        self.names = [name for name, _, _, _ in shard_types]
+        self.memory_mb = np.array([st[1] for st in shard_types], dtype=np.float64)
+        self.throughput = np.array([st[2] for st in shard_types], dtype=np.float64)
+        self.price = np.array([st[3] for st in shard_types], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+def _units(needed, capacity):
+    """Whole units of `capacity` covering `needed` (never negative)"""
+    return np.ceil(np.maximum(needed, 0) / capacity)
+
+def optimize(catalog, memory_mb, throughput_ops, ha_enabled=False, top_k=3):
+    """
+    Price every configuration that covers memory_mb and throughput_ops: N units of one
+    shard type, or a units of one type plus the fewest units of a second type that
+    cover the rest. All candidates are evaluated in one pass over NumPy arrays.
+    returns: up to top_k + 1 configurations, cheapest first, each
+    {'price': float, 'configuration': [{'unit_type': str, 'units': int}, ...]}
+    """
+    n = len(catalog)
+    if n == 0:
+        return []
+    mem, thr, price = catalog.memory_mb, catalog.throughput, catalog.price
+
+    # Single shard type: shape (n,)
+    single_units = np.maximum(_units(memory_mb, mem), _units(throughput_ops, thr))
+    single_price = single_units * price
+
+    # Two shard types i < j: a units of i (fewer than i needs alone), then the fewest units of j.
+    # Shapes: i on axis 0, j on axis 1, a on axis 2.
+    a = np.arange(1, MAX_MIX_UNITS + 1, dtype=np.float64)
+    rest_mem = memory_mb - a[None, :] * mem[:, None]  # (n, A)
+    rest_thr = throughput_ops - a[None, :] * thr[:, None]
+    b = np.maximum(_units(rest_mem[:, None, :], mem[None, :, None]),
+                   _units(rest_thr[:, None, :], thr[None, :, None]))  # (n, n, A)
+    mix_price = a[None, None, :] * price[:, None, None] + b * price[None, :, None]
+    valid = (np.triu(np.ones((n, n), dtype=bool), k=1)[:, :, None]
+             & (a[None, None, :] < single_units[:, None, None])
+             & (b >= 1))
+    mix_i, mix_j, mix_a = np.nonzero(valid)
+    mix_b = b[mix_i, mix_j, mix_a]
+    mix_price = mix_price[mix_i, mix_j, mix_a]
+
+    prices = np.concatenate([single_price, mix_price])
+    if ha_enabled:
+        prices = prices * 2
+    kinds = np.concatenate([np.zeros(n), np.ones(len(mix_price))])  # ties go to single-type configurations
+    order = np.lexsort((kinds, prices))[:top_k + 1]
+
+    configurations = []
+    for idx in order:
+        if idx < n:
+            parts = [(idx, single_units[idx])]
+        else:
+            m = idx - n
+            parts = [(mix_i[m], a[mix_a[m]]), (mix_j[m], mix_b[m])]
+        configurations.append({
+            'price': round(float(prices[idx]), 4),
+            'configuration': [{'unit_type': catalog.names[i], 'units': int(units)} for i, units in parts]
+        })
+    return configurations
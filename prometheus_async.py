@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import httpx
+
+import instrumentation
+import tracing
+
+class AsyncPrometheusClient:
+    """
+    Prometheus HTTP API client backed by one keep-alive httpx.AsyncClient running on a
+    private event loop thread. Concurrency is bounded by a semaphore and every batch
+    can be given an overall deadline, after which unfinished queries come back as None.
+    """
+
+    def __init__(self, base_url, max_concurrency=50, query_timeout=15):
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.query_timeout = query_timeout
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='prometheus-client', daemon=True)
+            thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+            self._loop = loop
+
+    async def _setup(self):
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+        self._client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.query_timeout)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _query(self, promql, params=None, parent=None):
+        async with self._semaphore:
+            start = time.perf_counter()
+            active = tracing.begin('prometheus_query', parent=parent, query=promql)
+            try:
+                resp = await self._client.get('/api/v1/query', params=dict(params or {}, query=promql))
+                resp.raise_for_status()
+                data = resp.json()
+                if data["status"] != "success":
+                    instrumentation.PROMETHEUS_QUERIES.labels('error').inc()
+                    return None
+                instrumentation.PROMETHEUS_QUERIES.labels('ok').inc()
+                return data["data"]["result"]
+            except Exception:
+                # Counted, not logged: an unreachable Prometheus fails every query of a refresh
+                instrumentation.PROMETHEUS_QUERIES.labels('error').inc()
+                return None
+            finally:
+                active.end()
+                instrumentation.PROMETHEUS_QUERY_DURATION.observe(time.perf_counter() - start)
+
+    async def _query_many(self, queries, params, deadline_seconds, parent=None):
+        tasks = {key: asyncio.ensure_future(self._query(promql, params, parent)) for key, promql in queries.items()}
+        if not tasks:
+            return {}
+        done, pending = await asyncio.wait(tasks.values(), timeout=deadline_seconds)
+        for task in pending:
+            task.cancel()
+        if pending:
+            instrumentation.PROMETHEUS_QUERIES.labels('timeout').inc(len(pending))
+        return {key: task.result() if task in done else None for key, task in tasks.items()}
+
+    def query(self, promql, params=None):
+        """Run one instant query. Returns the result list, or None on failure."""
+        return self.query_many({None: promql}, params=params)[None]
+
+    def query_many(self, queries, params=None, deadline_seconds=None):
+        """
+        Run instant queries concurrently.
+        queries: dict of {key: promql}
+        returns: dict of {key: result list or None}; queries still running when the
+        deadline passes are cancelled and returned as None
+        """
+        self._ensure_started()
+        # The event loop thread does not share the caller's context; hand it the span to trace under
+        parent = tracing.current_span()
+        future = asyncio.run_coroutine_threadsafe(self._query_many(queries, params, deadline_seconds, parent), self._loop)
+        return future.result()
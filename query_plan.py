@@ -0,0 +1,76 @@
+import re
+
+# Quoted label values are kept as-is; everything else has its whitespace removed
+_PROMQL_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|\s+|[^"\'\s]+')
+
+def normalize_promql(promql):
+    """
+    Canonical form of a PromQL expression for deduplication. Whitespace outside
+    string literals is dropped, except where it separates two words (e.g. 'max by').
+    """
+    parts = []
+    for token in _PROMQL_TOKEN.findall(promql.strip()):
+        if token.isspace():
+            parts.append(' ')
+        else:
+            parts.append(token)
+    normalized = []
+    for i, part in enumerate(parts):
+        if part == ' ':
+            prev = normalized[-1] if normalized else ''
+            nxt = parts[i + 1] if i + 1 < len(parts) else ''
+            if prev and nxt and (prev[-1].isalnum() or prev[-1] == '_') and (nxt[0].isalnum() or nxt[0] == '_'):
+                normalized.append(' ')
+            continue
+        normalized.append(part)
+    return ''.join(normalized)
+
+class QueryPlan:
+    """
+    Collects the PromQL expressions needed for one refresh, runs every distinct
+    expression once and fans each result out to all the keys that asked for it.
+    """
+
+    def __init__(self):
+        self._expressions = {}  # {normalized promql: promql}
+        self._consumers = []  # [(key, normalized promql)]
+        self._cached = 0
+
+    def add(self, key, promql):
+        normalized = normalize_promql(promql)
+        self._expressions.setdefault(normalized, promql)
+        self._consumers.append((key, normalized))
+
+    def execute(self, client, params=None, deadline_seconds=None, cache=None):
+        """
+        Run the plan with an AsyncPrometheusClient. With a cache (only for queries whose
+        results can no longer change, e.g. evaluated at a past time), expressions found
+        there are not sent and successful results are stored.
+        returns: dict of {key: result list or None}
+        """
+        params_key = tuple(sorted((params or {}).items()))
+        results = {}
+        pending = {}
+        for normalized, promql in self._expressions.items():
+            cached = cache.get((normalized, params_key)) if cache is not None else None
+            if cached is not None:
+                results[normalized] = cached
+            else:
+                pending[normalized] = promql
+        self._cached = len(results)
+        if pending:
+            fetched = client.query_many(pending, params=params, deadline_seconds=deadline_seconds)
+            for normalized, result in fetched.items():
+                results[normalized] = result
+                if cache is not None and result is not None:
+                    cache.set((normalized, params_key), result)
+        return {key: results.get(normalized) for key, normalized in self._consumers}
+
+    def stats(self):
+        return {
+            'requested': len(self._consumers),
+            'executed': len(self._expressions) - self._cached,
+            'saved': len(self._consumers) - len(self._expressions),
+            'cached': self._cached
+        }
+
@@ -0,0 +1,105 @@
+# Marks a field that was never set, so records behave like dicts without that key
+_UNSET = object()
+
+class Record:
+    """
+    Fixed-field result record with __slots__ storage and the read-only dict interface
+    the rest of the code expects (get, [], in, keys), so it can replace per-database dicts.
+    Fields that were never set are missing, exactly like an absent dict key.
+    """
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            setattr(self, field, values.pop(field, _UNSET))
+        if values:
+            raise TypeError(f"{type(self).__name__} has no fields {', '.join(values)}")
+
+    def get(self, key, default=None):
+        value = getattr(self, key, _UNSET) if key in self.__slots__ else _UNSET
+        return default if value is _UNSET else value
+
+    def __getitem__(self, key):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return self.get(key, _UNSET) is not _UNSET
+
+    def keys(self):
+        return [field for field in self.__slots__ if getattr(self, field) is not _UNSET]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def to_dict(self):
+        return {field: value.to_dict() if isinstance(value, Record) else value for field, value in self.items()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class MetricValues(Record):
+    __slots__ = ('throughput', 'throughput_limit', 'memory', 'memory_limit_bytes', 'cpu', 'latency_ms', 'payload_size_bytes')
+
+class StatusFlags(Record):
+    __slots__ = ('throughput_ok', 'memory_ok', 'cpu_ok', 'latency_ok', 'payload_size_ok')
+
+class MaxScaling(Record):
+    __slots__ = ('memory_gb', 'throughput_ops')
+
+class DatabaseRecord(Record):
+    """One database row of get_all_metrics(); `thresholds` is shared by every row of a refresh."""
+    __slots__ = (
+        'subscription_id', 'subscription_name', 'database_id', 'database_name',
+        'metrics', 'metrics_autoscale', 'thresholds', 'status', 'max_scaling',
+        'downscale_memory_mb', 'downscale_throughput_ops', 'downscale_price_suggestion',
+        'price_hourly', 'min_subscription_price', 'region', 'active_active', 'db_status'
+    )
+
+def to_json(value):
+    """json.dumps default= hook for records"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# metrics_autoscale limits are the same as in metrics, so the compact format sends them once
+_COMPACT_NESTED = (
+    ('metrics', MetricValues.__slots__),
+    ('metrics_autoscale', ('throughput', 'memory', 'cpu', 'latency_ms', 'payload_size_bytes')),
+    ('status', StatusFlags.__slots__),
+    ('max_scaling', MaxScaling.__slots__),
+)
+_COMPACT_FLAT = tuple(field for field in DatabaseRecord.__slots__
+                      if field != 'thresholds' and field not in dict(_COMPACT_NESTED))
+
+def encode_compact(databases):
+    """
+    Column-oriented form of a list of database records: the thresholds are sent once
+    and every field becomes one array with an entry per database ('metrics.cpu', ...).
+    A nested group a row does not have is marked in `<group>.present`.
+    returns: {'format': 'compact', 'count': n, 'thresholds': dict, 'columns': {name: list}}
+    """
+    columns = {field: [] for field in _COMPACT_FLAT}
+    for group, fields in _COMPACT_NESTED:
+        columns[f'{group}.present'] = []
+        for field in fields:
+            columns[f'{group}.{field}'] = []
+    thresholds = None
+    for db in databases:
+        if thresholds is None:
+            thresholds = db.get('thresholds')
+        for field in _COMPACT_FLAT:
+            columns[field].append(db.get(field))
+        for group, fields in _COMPACT_NESTED:
+            values = db.get(group)
+            columns[f'{group}.present'].append(values is not None)
+            for field in fields:
+                columns[f'{group}.{field}'].append(values.get(field) if values is not None else None)
+    return {'format': 'compact', 'count': len(databases), 'thresholds': thresholds, 'columns': columns}
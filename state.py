@@ -0,0 +1,272 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# Supported values of autoscale_state_backend
+STATE_BACKENDS = ('memory', 'sqlite', 'redis')
+
+def new_lease_token():
+    """Unique owner token of one lease acquisition (host, process and a random part)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+class MemoryStateBackend:
+    """
+    Autoscale state of this process only: enabled databases, per-database status,
+    recent scale actions and leases. The default; fine for a single app process.
+    Leases are atomic and expire after their ttl, like in the shared backends.
+    """
+
+    def __init__(self):
+        self._enabled = set()  # set of (subscription_id, database_id) tuples
+        self._status = {}  # {database_id: 'in_progress'|'done'|'failed'|'timeout'}
+        self._recent_actions = {}  # {database_id: {'values': dict, 'timestamp': float, 'task_id': str}}
+        self._leases = {}  # {name: (token, expires_at)}
+        self._lock = threading.Lock()
+
+    def enable(self, subscription_id, database_id):
+        with self._lock:
+            self._enabled.add((subscription_id, database_id))
+
+    def disable(self, subscription_id, database_id):
+        with self._lock:
+            self._enabled.discard((subscription_id, database_id))
+
+    def is_enabled(self, subscription_id, database_id):
+        with self._lock:
+            return (subscription_id, database_id) in self._enabled
+
+    def list_enabled(self):
+        with self._lock:
+            return list(self._enabled)
+
+    def set_status(self, database_id, status):
+        """returns: the previous status, or None"""
+        with self._lock:
+            previous = self._status.get(database_id)
+            self._status[database_id] = status
+            return previous
+
+    def get_statuses(self):
+        with self._lock:
+            return dict(self._status)
+
+    def get_recent_action(self, database_id):
+        with self._lock:
+            action = self._recent_actions.get(database_id)
+            return dict(action) if action else None
+
+    def put_recent_action(self, database_id, action):
+        with self._lock:
+            self._recent_actions[database_id] = dict(action)
+
+    def list_recent_actions(self):
+        with self._lock:
+            return {database_id: dict(action) for database_id, action in self._recent_actions.items()}
+
+    def acquire_lease(self, name, ttl_seconds, token=None):
+        """
+        Take the named lease unless someone else holds an unexpired one.
+        Passing the token of a lease already held renews it.
+        returns: the lease token, or None if it is held by someone else
+        """
+        token = token or new_lease_token()
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[1] > now and holder[0] != token:
+                return None
+            self._leases[name] = (token, now + ttl_seconds)
+        return token
+
+    def release_lease(self, name, token):
+        """Release a lease if token still holds it"""
+        with self._lock:
+            holder = self._leases.get(name)
+            if holder is not None and holder[0] == token:
+                del self._leases[name]
+
+class SQLiteStateBackend:
+    """
+    Autoscale state in a SQLite database shared by every app process on one host
+    (e.g. gunicorn workers). Leases are taken in one conditional upsert, so only
+    one process can hold a subscription's scale lock at a time.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS autoscale_enabled (
+            subscription_id TEXT NOT NULL, database_id TEXT NOT NULL,
+            PRIMARY KEY (subscription_id, database_id));
+        CREATE TABLE IF NOT EXISTS autoscale_status (
+            database_id TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS autoscale_actions (
+            database_id TEXT PRIMARY KEY, action TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(self._SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections must stay on the thread that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, statements):
+        """Run (sql, params) statements in one write transaction; returns the cursor of the last one"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                cursor = connection.execute(sql, params)
+            connection.execute('COMMIT')
+            return cursor
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def enable(self, subscription_id, database_id):
+        self._connection().execute(
+            'INSERT OR IGNORE INTO autoscale_enabled VALUES (?, ?)', (subscription_id, database_id))
+
+    def disable(self, subscription_id, database_id):
+        self._connection().execute(
+            'DELETE FROM autoscale_enabled WHERE subscription_id = ? AND database_id = ?', (subscription_id, database_id))
+
+    def is_enabled(self, subscription_id, database_id):
+        return self._connection().execute(
+            'SELECT 1 FROM autoscale_enabled WHERE subscription_id = ? AND database_id = ?',
+            (subscription_id, database_id)).fetchone() is not None
+
+    def list_enabled(self):
+        return [tuple(row) for row in self._connection().execute('SELECT subscription_id, database_id FROM autoscale_enabled')]
+
+    def set_status(self, database_id, status):
+        """returns: the previous status, or None"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT status FROM autoscale_status WHERE database_id = ?', (database_id,)).fetchone()
+            connection.execute('INSERT OR REPLACE INTO autoscale_status VALUES (?, ?, ?)', (database_id, status, time.time()))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return row[0] if row else None
+
+    def get_statuses(self):
+        return dict(self._connection().execute('SELECT database_id, status FROM autoscale_status'))
+
+    def get_recent_action(self, database_id):
+        row = self._connection().execute('SELECT action FROM autoscale_actions WHERE database_id = ?', (database_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_recent_action(self, database_id, action):
+        self._connection().execute('INSERT OR REPLACE INTO autoscale_actions VALUES (?, ?)', (database_id, json.dumps(action)))
+
+    def list_recent_actions(self):
+        return {database_id: json.loads(action) for database_id, action in self._connection().execute('SELECT database_id, action FROM autoscale_actions')}
+
+    def acquire_lease(self, name, ttl_seconds, token=None):
+        """See MemoryStateBackend.acquire_lease"""
+        token = token or new_lease_token()
+        now = time.time()
+        cursor = self._transaction([(
+            'INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE '
+            'SET token = excluded.token, expires_at = excluded.expires_at '
+            'WHERE leases.expires_at <= ? OR leases.token = excluded.token',
+            (name, token, now + ttl_seconds, now)
+        )])
+        return token if cursor.rowcount == 1 else None
+
+    def release_lease(self, name, token):
+        self._connection().execute('DELETE FROM leases WHERE name = ? AND token = ?', (name, token))
+
+class RedisStateBackend:
+    """
+    Autoscale state in Redis, shared by app processes on any number of hosts.
+    Needs the redis package (pip install redis).
+    """
+
+    # Delete or extend a lease only while the caller's token still holds it
+    _RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    _RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+
+    def __init__(self, url, prefix='redis-health:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("autoscale_state_backend 'redis' needs the redis package (pip install redis)")
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._release = self._client.register_script(self._RELEASE_SCRIPT)
+        self._renew = self._client.register_script(self._RENEW_SCRIPT)
+
+    def _key(self, name):
+        return f"{self._prefix}{name}"
+
+    def enable(self, subscription_id, database_id):
+        self._client.sadd(self._key('enabled'), json.dumps([subscription_id, database_id]))
+
+    def disable(self, subscription_id, database_id):
+        self._client.srem(self._key('enabled'), json.dumps([subscription_id, database_id]))
+
+    def is_enabled(self, subscription_id, database_id):
+        return bool(self._client.sismember(self._key('enabled'), json.dumps([subscription_id, database_id])))
+
+    def list_enabled(self):
+        return [tuple(json.loads(member)) for member in self._client.smembers(self._key('enabled'))]
+
+    def set_status(self, database_id, status):
+        """returns: the previous status, or None"""
+        pipeline = self._client.pipeline()
+        pipeline.hget(self._key('status'), database_id)
+        pipeline.hset(self._key('status'), database_id, status)
+        previous, _ = pipeline.execute()
+        return previous
+
+    def get_statuses(self):
+        return self._client.hgetall(self._key('status'))
+
+    def get_recent_action(self, database_id):
+        action = self._client.hget(self._key('actions'), database_id)
+        return json.loads(action) if action else None
+
+    def put_recent_action(self, database_id, action):
+        self._client.hset(self._key('actions'), database_id, json.dumps(action))
+
+    def list_recent_actions(self):
+        return {database_id: json.loads(action) for database_id, action in self._client.hgetall(self._key('actions')).items()}
+
+    def acquire_lease(self, name, ttl_seconds, token=None):
+        """See MemoryStateBackend.acquire_lease"""
+        key = self._key(f'lease:{name}')
+        ttl_ms = max(1, int(ttl_seconds * 1000))
+        if token and self._renew(keys=[key], args=[token, ttl_ms]):
+            return token
+        token = token or new_lease_token()
+        return token if self._client.set(key, token, nx=True, px=ttl_ms) else None
+
+    def release_lease(self, name, token):
+        self._release(keys=[self._key(f'lease:{name}')], args=[token])
+
+def create_state_backend(kind, path=None, url=None):
+    """Backend named by autoscale_state_backend: 'memory', 'sqlite' (path) or 'redis' (url)"""
+    if kind == 'memory':
+        return MemoryStateBackend()
+    if kind == 'sqlite':
+        return SQLiteStateBackend(path)
+    if kind == 'redis':
+        return RedisStateBackend(url)
+    raise ValueError(f"autoscale_state_backend must be one of {', '.join(STATE_BACKENDS)}, got {kind!r}")
@@ -51,6 +51,23 @@ function formatPriceHourly(price) {
     return `$${price.toFixed(3)}/hr`;
 }
 
+function formatShardConfiguration(configuration) {
+    return configuration
+        .map(part => part.units > 1 ? `${part.unit_type} x${part.units}` : part.unit_type)
+        .join(' + ');
+}
+
+function formatPriceSuggestion(suggestion) {
+    if (!suggestion) return '';
+    // Older responses carry only the single-type fields
+    const configuration = suggestion.configuration || [{ unit_type: suggestion.unit_type, units: suggestion.units_needed }];
+    const alternatives = (suggestion.alternatives || [])
+        .map(alt => `$${alt.price}/hr: ${formatShardConfiguration(alt.configuration)}`)
+        .join('\n');
+    const title = alternatives ? ` title="Alternatives:\n${alternatives}"` : '';
+    return `<div class='price-suggestion'${title}>💲 $${suggestion.price}/hr (${formatShardConfiguration(configuration)})</div>`;
+}
+
 function formatMinSubscriptionPrice(price) {
     if (price === null || price === undefined) return 'N/A';
     return `$${price.toFixed(3)}/hr`;
@@ -371,6 +388,220 @@ function hideLoadingProgress() {
     }
 }
 
+// Expand the compact (columnar) /api/metrics format into one object per database
+function decodeCompactDatabases(compact) {
+    const columns = compact.columns;
+    const groups = {};
+    const flat = [];
+    Object.keys(columns).forEach(name => {
+        const dot = name.indexOf('.');
+        if (dot === -1) {
+            flat.push(name);
+        } else if (!name.endsWith('.present')) {
+            const group = name.slice(0, dot);
+            (groups[group] = groups[group] || []).push(name.slice(dot + 1));
+        }
+    });
+    const dbs = [];
+    for (let i = 0; i < compact.count; i++) {
+        const db = { thresholds: compact.thresholds };
+        flat.forEach(name => { db[name] = columns[name][i]; });
+        Object.entries(groups).forEach(([group, fields]) => {
+            if (!columns[`${group}.present`][i]) return;
+            const values = {};
+            fields.forEach(field => { values[field] = columns[`${group}.${field}`][i]; });
+            db[group] = values;
+        });
+        // Limits are only sent with metrics
+        if (db.metrics_autoscale && db.metrics) {
+            db.metrics_autoscale.throughput_limit = db.metrics.throughput_limit;
+            db.metrics_autoscale.memory_limit_bytes = db.metrics.memory_limit_bytes;
+        }
+        dbs.push(db);
+    }
+    return dbs;
+}
+
+// Rows currently shown, keyed by "<subscription_id>_<database_id>", and the snapshot they came from
+const tableState = {
+    period: null,
+    generation: null,
+    rows: new Map()
+};
+
+function dbKey(db) {
+    return `${db.subscription_id}_${db.database_id}`;
+}
+
+function renderSubscriptionHeader(subName, subId, count) {
+    const collapseId = `collapse-${subId}`;
+    return `
+        <tr class="subscription-row" data-subscription="${subId}">
+            <td class="subscription-header" colspan="10">
+                <div class="subscription-header-content">
+                    <button class="collapse-btn" onclick="toggleSubscription('${collapseId}')" title="Toggle subscription">
+                        <i class="fas fa-chevron-down"></i>
+                    </button>
+                    <span class="subscription-name">${subName}</span>
+                    <span class="subscription-count">(${count} database${count > 1 ? 's' : ''})</span>
+                </div>
+            </td>
+        </tr>
+    `;
+}
+
+function renderDatabaseRow(db, subId) {
+    const collapseId = `collapse-${subId}`;
+    const m = db.metrics;
+    const t = getThresholds(db);
+    // Calculate OK status with custom thresholds if set
+    const throughput_ok = m.throughput !== null && m.throughput < t.throughput_threshold * m.throughput_limit;
+    const memory_ok = m.memory !== null && m.memory < t.memory_threshold * m.memory_limit_bytes;
+    const cpu_ok = m.cpu !== null && m.cpu < t.cpu_threshold * 100;
+    const latency_ok = m.latency_ms !== null && (m.latency_ms * 1000) < t.latency_threshold_ms;
+    const payload_size_ok = m.payload_size_bytes !== null && m.payload_size_bytes < (t.payload_size_threshold_kb || 1024) * 1024;
+    const summary = getStatusSummary(throughput_ok, memory_ok, cpu_ok, latency_ok, payload_size_ok, m);
+    
+    const dbId = db.database_id;
+    const enabledKey = `${subId}_${dbId}`;
+    let checked = autoscaleEnabled[enabledKey] ? 'checked' : '';
+    let autoscaleCell = `<input type="checkbox" class="autoscale-checkbox" data-db="${dbId}" data-sub="${subId}" ${checked} />`;
+    
+    // Build table row with conditional autoscaling cell
+    let rowHTML = `
+        <tr class="database-row ${collapseId}" data-subscription="${subId}" data-key="${enabledKey}">
+            <td></td>
+            <td>${db.database_name}</td>
+            <td class="${m.throughput === null || m.throughput === undefined ? 'na' : (throughput_ok ? 'ok' : 'fail')}">
+                <div class="value">${formatThroughput(m.throughput, m.throughput_limit)}</div>
+                ${db.downscale_throughput_ops ? `<div class='downscale-suggestion'>↓ Suggest: ${db.downscale_throughput_ops.toLocaleString()} ops</div>` : ''}
+            </td>
+            <td class="${m.memory === null || m.memory === undefined ? 'na' : (memory_ok ? 'ok' : 'fail')}">
+                <div class="value">${formatBytes(m.memory)} / ${formatBytes(m.memory_limit_bytes)}</div>
+                ${db.downscale_memory_mb ? `<div class='downscale-suggestion'>↓ Suggest: ${db.downscale_memory_mb} MB</div>` : ''}
+            </td>
+            <td class="${m.cpu === null || m.cpu === undefined ? 'na' : (cpu_ok ? 'ok' : 'fail')}">
+                <div class="value">${formatCPU(m.cpu, t.cpu_threshold)}</div>
+            </td>
+            <td class="${m.latency_ms === null || m.latency_ms === undefined ? 'na' : (latency_ok ? 'ok' : 'fail')}">
+                <div class="value">${formatLatency(m.latency_ms, t.latency_threshold_ms)}</div>
+            </td>
+            <td class="${m.payload_size_bytes === null || m.payload_size_bytes === undefined ? 'na' : (payload_size_ok ? 'ok' : 'fail')}">
+                <div class="value">${formatPayloadSize(m.payload_size_bytes)}</div>
+            </td>
+            <td>${summary}`;
+    
+    // Add autoscaling cells
+    rowHTML += `<td>${autoscaleCell}</td>`;
+    rowHTML += `<td><div class="value">${formatMaxScaling(db.max_scaling?.memory_gb, db.max_scaling?.throughput_ops)}</div></td>`;
+    
+    rowHTML += `
+            <td><div class="value">${formatPriceHourly(db.price_hourly)}</div>
+                ${formatPriceSuggestion(db.downscale_price_suggestion)}
+            </td>
+            <td><div class="value">${formatMinSubscriptionPrice(db.min_subscription_price)}</div></td>
+        </tr>
+    `;
+    return rowHTML;
+}
+
+// Rebuild the whole table from tableState.rows, grouped by subscription
+function renderTable() {
+    const tbody = document.querySelector('#metricsTable tbody');
+    const groupedData = {};
+    tableState.rows.forEach(db => {
+        const subName = db.subscription_name;
+        if (!groupedData[subName]) {
+            groupedData[subName] = [];
+        }
+        groupedData[subName].push(db);
+    });
+    
+    const html = [];
+    Object.keys(groupedData).forEach(subName => {
+        const databases = groupedData[subName];
+        const subId = databases[0].subscription_id;
+        html.push(renderSubscriptionHeader(subName, subId, databases.length));
+        databases.forEach(db => html.push(renderDatabaseRow(db, subId)));
+    });
+    tbody.innerHTML = html.join('');
+}
+
+// Replace only the rows that changed; added or removed databases re-render the table
+function applyDelta(changed, removed, previousEnabled) {
+    let structureChanged = removed.length > 0;
+    removed.forEach(key => tableState.rows.delete(key));
+    const dirty = new Set();
+    changed.forEach(db => {
+        const key = dbKey(db);
+        if (!tableState.rows.has(key)) {
+            structureChanged = true;
+        }
+        tableState.rows.set(key, db);
+        dirty.add(key);
+    });
+    // Autoscale toggles changed elsewhere are not part of the metrics delta
+    tableState.rows.forEach((db, key) => {
+        if (!!previousEnabled[key] !== !!autoscaleEnabled[key]) {
+            dirty.add(key);
+        }
+    });
+    if (structureChanged) {
+        renderTable();
+        return;
+    }
+    const tbody = document.querySelector('#metricsTable tbody');
+    dirty.forEach(key => {
+        const row = tbody.querySelector(`tr[data-key="${key}"]`);
+        if (!row) return;
+        const db = tableState.rows.get(key);
+        const template = document.createElement('template');
+        template.innerHTML = renderDatabaseRow(db, db.subscription_id).trim();
+        const newRow = template.content.firstChild;
+        newRow.style.display = row.style.display; // Keep collapsed subscriptions collapsed
+        row.replaceWith(newRow);
+    });
+}
+
+// Show a /api/metrics response (full or delta) in the table and summary
+function applyMetricsResponse(data, period, canPatch, previousEnabled) {
+    const dbs = data.databases && data.databases.format === 'compact'
+        ? decodeCompactDatabases(data.databases)
+        : (data.databases || data);
+    
+    // Show/hide warning banner
+    let banner = document.getElementById('prometheus-warning');
+    if (!banner && data.prometheus_available === false) {
+        banner = document.createElement('div');
+        banner.id = 'prometheus-warning';
+        banner.className = 'notification notification-info show';
+        banner.innerHTML = '<i class="fas fa-info-circle"></i> Live metrics unavailable. Showing configuration data only.';
+        document.body.prepend(banner);
+    } else if (banner && data.prometheus_available !== false) {
+        banner.remove();
+    }
+    
+    if (data.delta && canPatch) {
+        applyDelta(dbs, data.removed || [], previousEnabled);
+    } else {
+        tableState.rows = new Map(dbs.map(db => [dbKey(db), db]));
+        renderTable();
+    }
+    tableState.period = period === 'absolute' ? null : period;
+    tableState.generation = data.generation ?? null;
+    
+    // Calculate and display summary stats
+    const stats = calculateSummaryStats(Array.from(tableState.rows.values()));
+    document.getElementById('total-dbs').textContent = stats.total;
+    document.getElementById('healthy-dbs').textContent = stats.healthy;
+    document.getElementById('attention-dbs').textContent = stats.attention;
+    document.getElementById('autoscale-enabled').textContent = stats.autoscaleCount;
+    document.getElementById('summary-stats').style.display = 'block';
+    
+    // Update last updated timestamp
+    updateLastUpdated();
+}
+
 // Main data loading function
 async function loadData(isAutoRefresh = false) {
     if (isLoading) return;
@@ -385,141 +616,32 @@ async function loadData(isAutoRefresh = false) {
     try {
         // Get time range selection
         let period = document.getElementById('time-range-select')?.value || '5m';
-        let params = [];
+        let params = ['format=compact'];
         if (period === 'absolute') {
             const absFrom = document.getElementById('abs-from').value;
             const absTo = document.getElementById('abs-to').value;
             if (absFrom && absTo) {
-                params.push('abs_from=' + encodeURIComponent(absFrom));
-                params.push('abs_to=' + encodeURIComponent(absTo));
+                // datetime-local values are in the browser's time zone; send them as UTC
+                params.push('abs_from=' + encodeURIComponent(new Date(absFrom).toISOString()));
+                params.push('abs_to=' + encodeURIComponent(new Date(absTo).toISOString()));
             }
         } else {
             params.push('period=' + encodeURIComponent(period));
         }
+        // Auto-refreshes of the same period only ask for what changed since the last generation
+        const canPatch = isAutoRefresh && period !== 'absolute' && tableState.period === period && tableState.generation !== null;
+        if (canPatch) {
+            params.push('since=' + encodeURIComponent(tableState.generation));
+        }
         const res = await fetch('/api/metrics' + (params.length ? ('?' + params.join('&')) : ''));
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
         const data = await res.json();
         setLoadingState(false); // Hide spinner as soon as data is fetched
-        const dbs = data.databases || data;
-        
+        const previousEnabled = autoscaleEnabled;
         await fetchAutoscaleEnabled();
         await fetchAutoscaleStatus();
         
-        // Show/hide warning banner
-        let banner = document.getElementById('prometheus-warning');
-        if (!banner && data.prometheus_available === false) {
-            banner = document.createElement('div');
-            banner.id = 'prometheus-warning';
-            banner.className = 'notification notification-info show';
-            banner.innerHTML = '<i class="fas fa-info-circle"></i> Live metrics unavailable. Showing configuration data only.';
-            document.body.prepend(banner);
-        } else if (banner && data.prometheus_available !== false) {
-            banner.remove();
-        }
-        
-        const tbody = document.querySelector('#metricsTable tbody');
-        tbody.innerHTML = '';
-        
-        // Calculate and display summary stats
-        const stats = calculateSummaryStats(dbs);
-        document.getElementById('total-dbs').textContent = stats.total;
-        document.getElementById('healthy-dbs').textContent = stats.healthy;
-        document.getElementById('attention-dbs').textContent = stats.attention;
-        document.getElementById('autoscale-enabled').textContent = stats.autoscaleCount;
-        document.getElementById('summary-stats').style.display = 'block';
-        
-        // Group data by subscription
-        const groupedData = {};
-        dbs.forEach(db => {
-            const subName = db.subscription_name;
-            if (!groupedData[subName]) {
-                groupedData[subName] = [];
-            }
-            groupedData[subName].push(db);
-        });
-        
-        // Render grouped data
-        Object.keys(groupedData).forEach(subName => {
-            const databases = groupedData[subName];
-            const subId = databases[0].subscription_id;
-            const collapseId = `collapse-${subId}`;
-            
-            // Add subscription header with collapse button
-            tbody.innerHTML += `
-                <tr class="subscription-row" data-subscription="${subId}">
-                    <td class="subscription-header" colspan="10">
-                        <div class="subscription-header-content">
-                            <button class="collapse-btn" onclick="toggleSubscription('${collapseId}')" title="Toggle subscription">
-                                <i class="fas fa-chevron-down"></i>
-                            </button>
-                            <span class="subscription-name">${subName}</span>
-                            <span class="subscription-count">(${databases.length} database${databases.length > 1 ? 's' : ''})</span>
-                        </div>
-                    </td>
-                </tr>
-            `;
-            
-            // Add database rows
-            databases.forEach((db, index) => {
-                const m = db.metrics;
-                const t = getThresholds(db);
-                // Debug: log throughput_limit
-                console.log('DB', db.database_name, 'throughput_limit:', m.throughput_limit);
-                // Calculate OK status with custom thresholds if set
-                const throughput_ok = m.throughput !== null && m.throughput < t.throughput_threshold * m.throughput_limit;
-                const memory_ok = m.memory !== null && m.memory < t.memory_threshold * m.memory_limit_bytes;
-                const cpu_ok = m.cpu !== null && m.cpu < t.cpu_threshold * 100;
-                const latency_ok = m.latency_ms !== null && (m.latency_ms * 1000) < t.latency_threshold_ms;
-                const payload_size_ok = m.payload_size_bytes !== null && m.payload_size_bytes < (t.payload_size_threshold_kb || 1024) * 1024;
-                const summary = getStatusSummary(throughput_ok, memory_ok, cpu_ok, latency_ok, payload_size_ok, m);
-                
-                const dbId = db.database_id;
-                const enabledKey = `${subId}_${dbId}`;
-                let checked = autoscaleEnabled[enabledKey] ? 'checked' : '';
-                let autoscaleCell = `<input type="checkbox" class="autoscale-checkbox" data-db="${dbId}" data-sub="${subId}" ${checked} />`;
-                
-                // Build table row with conditional autoscaling cell
-                let rowHTML = `
-                    <tr class="database-row ${collapseId}" data-subscription="${subId}">
-                        <td></td>
-                        <td>${db.database_name}</td>
-                        <td class="${m.throughput === null || m.throughput === undefined ? 'na' : (throughput_ok ? 'ok' : 'fail')}">
-                            <div class="value">${formatThroughput(m.throughput, m.throughput_limit)}</div>
-                            ${db.downscale_throughput_ops ? `<div class='downscale-suggestion'>↓ Suggest: ${db.downscale_throughput_ops.toLocaleString()} ops</div>` : ''}
-                        </td>
-                        <td class="${m.memory === null || m.memory === undefined ? 'na' : (memory_ok ? 'ok' : 'fail')}">
-                            <div class="value">${formatBytes(m.memory)} / ${formatBytes(m.memory_limit_bytes)}</div>
-                            ${db.downscale_memory_mb ? `<div class='downscale-suggestion'>↓ Suggest: ${db.downscale_memory_mb} MB</div>` : ''}
-                        </td>
-                        <td class="${m.cpu === null || m.cpu === undefined ? 'na' : (cpu_ok ? 'ok' : 'fail')}">
-                            <div class="value">${formatCPU(m.cpu, t.cpu_threshold)}</div>
-                        </td>
-                        <td class="${m.latency_ms === null || m.latency_ms === undefined ? 'na' : (latency_ok ? 'ok' : 'fail')}">
-                            <div class="value">${formatLatency(m.latency_ms, t.latency_threshold_ms)}</div>
-                        </td>
-                        <td class="${m.payload_size_bytes === null || m.payload_size_bytes === undefined ? 'na' : (payload_size_ok ? 'ok' : 'fail')}">
-                            <div class="value">${formatPayloadSize(m.payload_size_bytes)}</div>
-                        </td>
-                        <td>${summary}`;
-                
-                // Add autoscaling cells
-                rowHTML += `<td>${autoscaleCell}</td>`;
-                rowHTML += `<td><div class="value">${formatMaxScaling(db.max_scaling?.memory_gb, db.max_scaling?.throughput_ops)}</div></td>`;
-                
-                rowHTML += `
-                        <td><div class="value">${formatPriceHourly(db.price_hourly)}</div>
-                            ${db.downscale_price_suggestion ? `<div class='price-suggestion'>💲 $${db.downscale_price_suggestion.price}/hr (${db.downscale_price_suggestion.unit_type}${db.downscale_price_suggestion.units_needed > 1 ? ' x' + db.downscale_price_suggestion.units_needed : ''})</div>` : ''}
-                        </td>
-                        <td><div class="value">${formatMinSubscriptionPrice(db.min_subscription_price)}</div></td>
-                    </tr>
-                `;
-                
-                tbody.innerHTML += rowHTML;
-            });
-        });
-        
-        // Update last updated timestamp
-        updateLastUpdated();
+        applyMetricsResponse(data, period, canPatch, previousEnabled);
         
         // Mark as loaded and hide progress
         window.dataLoaded = true;
@@ -527,24 +649,18 @@ async function loadData(isAutoRefresh = false) {
             hideLoadingProgress();
         }
         
-        // Start countdown for next auto-refresh if enabled
+        // Start countdown for next auto-refresh if polling
         if (window.autoRefreshInterval) {
-            startCountdown(30); // 30 seconds
+            startCountdown(Math.round(pollIntervalMs / 1000));
         }
         
-        // Add event listeners to autoscale checkboxes
-        document.querySelectorAll('.autoscale-checkbox').forEach(cb => {
-            cb.addEventListener('change', async function() {
-                await setAutoscaleEnabled(this.getAttribute('data-sub'), this.getAttribute('data-db'), this.checked);
-            });
-        });
-        
     } catch (error) {
         setLoadingState(false);
         console.error('Failed to load data:', error);
         if (!isAutoRefresh) {
             showNotification('Failed to load metrics data', 'error');
         }
+        tableState.generation = null; // The table no longer shows the rows a delta would patch
         const errorColspan = 10;
         document.querySelector('#metricsTable tbody').innerHTML = `
             <tr>
@@ -557,6 +673,87 @@ async function loadData(isAutoRefresh = false) {
     }
 }
 
+// --- Live updates ---
+// With /api/stream connected, auto-refresh is pushed by the server; polling is the fallback
+let autoRefreshOn = false;
+let pollIntervalMs = 30000;
+let liveStream = null;
+let streamConnected = false;
+
+function schedulePolling() {
+    if (window.autoRefreshInterval) {
+        clearInterval(window.autoRefreshInterval);
+        window.autoRefreshInterval = null;
+    }
+    stopCountdown();
+    if (!autoRefreshOn || streamConnected) return;
+    window.autoRefreshInterval = setInterval(() => loadData(true), pollIntervalMs);
+    startCountdown(Math.round(pollIntervalMs / 1000));
+}
+
+function startAutoRefresh() {
+    autoRefreshOn = true;
+    schedulePolling();
+}
+
+function stopAutoRefresh() {
+    autoRefreshOn = false;
+    schedulePolling();
+}
+
+function handleMetricsEvent(data) {
+    if (!autoRefreshOn || isLoading) return;
+    const period = document.getElementById('time-range-select')?.value || '5m';
+    if (period === 'absolute' || data.period !== period) return;
+    if (data.delta && data.since === tableState.generation) {
+        applyMetricsResponse(data, period, true, autoscaleEnabled);
+    } else if (data.generation !== tableState.generation) {
+        loadData(true); // Missed an update or no delta available: fetch what changed
+    }
+}
+
+function connectLiveStream() {
+    if (!window.EventSource || liveStream) return;
+    liveStream = new EventSource('/api/stream');
+    liveStream.onopen = () => {
+        streamConnected = true;
+        schedulePolling();
+        // Catch up on anything published while disconnected
+        if (autoRefreshOn && window.dataLoaded) loadData(true);
+    };
+    liveStream.onerror = () => {
+        // EventSource reconnects by itself; poll in the meantime
+        if (streamConnected) {
+            streamConnected = false;
+            schedulePolling();
+        }
+    };
+    liveStream.addEventListener('metrics', event => handleMetricsEvent(JSON.parse(event.data)));
+    liveStream.addEventListener('autoscale_status', event => {
+        const data = JSON.parse(event.data);
+        autoscaleStatus[data.database_id] = data.status;
+    });
+    liveStream.addEventListener('autoscale_enabled', event => {
+        const data = JSON.parse(event.data);
+        const previousEnabled = { ...autoscaleEnabled };
+        const key = `${data.subscription_id}_${data.database_id}`;
+        if (data.enabled) {
+            autoscaleEnabled[key] = true;
+        } else {
+            delete autoscaleEnabled[key];
+        }
+        if (!!previousEnabled[key] !== !!autoscaleEnabled[key]) {
+            applyDelta([], [], previousEnabled);
+            document.getElementById('autoscale-enabled').textContent = calculateSummaryStats(Array.from(tableState.rows.values())).autoscaleCount;
+        }
+    });
+    liveStream.addEventListener('task', event => {
+        const task = JSON.parse(event.data);
+        const ok = task.outcome === 'done';
+        showNotification(`Scaling DB ${task.database_id} ${ok ? 'completed' : task.outcome}`, ok ? 'success' : 'error');
+    });
+}
+
 function setupThresholdControls() {
     const controls = document.getElementById('threshold-controls');
     controls.innerHTML = `
@@ -675,14 +872,20 @@ function stopCountdown() {
 document.addEventListener('DOMContentLoaded', async function() {
     setupThresholdControls(); // Only once on page load
     
-    // Fetch config for Prometheus interval
-    let prometheusInterval = 30000;
+    // Rows are replaced on every refresh, so listen for autoscale toggles on the table body
+    document.querySelector('#metricsTable tbody').addEventListener('change', async function(event) {
+        const cb = event.target;
+        if (!cb.classList.contains('autoscale-checkbox')) return;
+        await setAutoscaleEnabled(cb.getAttribute('data-sub'), cb.getAttribute('data-db'), cb.checked);
+    });
+    
+    // Fetch config for Prometheus interval (used when polling)
     try {
         const res = await fetch('/api/config');
         if (res.ok) {
             const config = await res.json();
             if (config.prometheus_query_interval_seconds) {
-                prometheusInterval = config.prometheus_query_interval_seconds * 1000;
+                pollIntervalMs = config.prometheus_query_interval_seconds * 1000;
             }
         }
     } catch (e) { /* fallback to default */ }
@@ -690,11 +893,9 @@ document.addEventListener('DOMContentLoaded', async function() {
     // Load initial data
     loadData();
     
-                    // Auto-refresh using config interval with improved UX
-        window.autoRefreshInterval = setInterval(() => loadData(true), prometheusInterval);
-        
-        // Start initial countdown
-        startCountdown(30);
+        // Live updates over /api/stream, polling until (or unless) it connects
+        startAutoRefresh();
+        connectLiveStream();
         
         // Add manual cloud refresh button
     const controlPanel = document.querySelector('.control-panel');
@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Redis Cloud task states that will not change any more
+TASK_SUCCESS_STATES = {'processing-completed', 'completed', 'success'}
+TASK_FAILURE_STATES = {'processing-error', 'failed', 'error'}
+
+class TaskTracker:
+    """
+    Polls outstanding Redis Cloud tasks in the background with exponential backoff and
+    reports each one once it finishes, so no caller has to wait on a pending task.
+    fetch_task(task_id) must return the task JSON, or None if it could not be read.
+    """
+
+    def __init__(self, fetch_task, initial_delay=2, max_delay=30, timeout_seconds=1800, max_workers=8, history_size=100):
+        self.fetch_task = fetch_task
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task-poll')
+        self._tasks = {}  # {task_id: dict}
+        self._finished = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='task-tracker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def track(self, task_id, subscription_id, database_id, values=None, on_complete=None, on_poll=None, created_at=None):
+        """
+        Start tracking a task. on_complete(task) is called from a tracker thread with
+        the final task record once the task succeeds, fails or times out; on_poll(task)
+        after every poll that leaves it unfinished. created_at (default now) is when the
+        task was started; the timeout counts from it.
+        """
+        now = time.time()
+        with self._lock:
+            self._tasks[task_id] = {
+                'task_id': task_id,
+                'subscription_id': str(subscription_id),
+                'database_id': str(database_id),
+                'values': values,
+                'status': 'received',
+                'outcome': None,
+                'created_at': created_at or now,
+                'updated_at': now,
+                'polls': 0,
+                'next_poll': now + self.initial_delay,
+                'delay': self.initial_delay,
+                'on_complete': on_complete,
+                'on_poll': on_poll,
+            }
+        self._wakeup.set()
+
+    def get_tasks(self):
+        """Return in-flight tasks and the most recently finished ones."""
+        with self._lock:
+            in_flight = [_public(task) for task in self._tasks.values()]
+            finished = list(self._finished)
+        return {'in_flight': in_flight, 'finished': finished}
+
+    def _poll(self, task_id):
+        task_data = self.fetch_task(task_id)
+        now = time.time()
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return
+            task['polls'] += 1
+            task['updated_at'] = now
+            status = task_data.get('status') if task_data else None
+            if status:
+                task['status'] = status
+            if status in TASK_SUCCESS_STATES:
+                task['outcome'] = 'done'
+            elif status in TASK_FAILURE_STATES:
+                task['outcome'] = 'failed'
+                task['error'] = (task_data.get('response') or {}).get('error')
+            elif now - task['created_at'] > self.timeout_seconds:
+                task['outcome'] = 'timeout'
+            if task['outcome'] is None:
+                task['delay'] = min(task['delay'] * 2, self.max_delay)
+                task['next_poll'] = now + task['delay']
+                task['polling'] = False
+                self._wakeup.set()
+            else:
+                del self._tasks[task_id]
+                self._finished.appendleft(_public(task))
+            # Read under the lock: once polling is False the next poll may already be running
+            public = _public(task)
+            callback = task['on_poll'] if public['outcome'] is None else task['on_complete']
+        if public['outcome'] is not None:
+            print(f"Task {task_id} for DB {public['database_id']} finished: {public['outcome']} ({public['status']})")
+        if callback:
+            try:
+                callback(public)
+            except Exception as e:
+                print(f"Task callback failed for {task_id}: {e}")
+
+    def _poll_safely(self, task_id):
+        try:
+            self._poll(task_id)
+        except Exception as e:
+            print(f"Error polling task {task_id}: {e}")
+            with self._lock:
+                task = self._tasks.get(task_id)
+                if task is not None:
+                    task['next_poll'] = time.time() + task['delay']
+                    task['polling'] = False
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.time()
+            with self._lock:
+                due = [task_id for task_id, task in self._tasks.items()
+                       if task['next_poll'] <= now and not task.get('polling')]
+                for task_id in due:
+                    self._tasks[task_id]['polling'] = True
+                next_poll = min((task['next_poll'] for task in self._tasks.values() if not task.get('polling')), default=None)
+            for task_id in due:
+                self._executor.submit(self._poll_safely, task_id)
+            timeout = self.max_delay if next_poll is None else max(0.1, next_poll - now)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+def _public(task):
+    return {key: value for key, value in task.items() if key not in ('on_complete', 'on_poll', 'polling', 'next_poll', 'delay')}
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# throughput.py reads config.yaml from the working directory on import; run the tests
+# in a scratch directory with a config that keeps state in memory and writes no journal
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+_workdir = tempfile.mkdtemp(prefix='redis-health-tests-')
+with open(os.path.join(_workdir, 'config.yaml'), 'w') as f:
+    f.write("prometheus_server_url: http://127.0.0.1:9\n"
+            "cloud_api_url: http://127.0.0.1:9/v1\n"
+            "autoscale_state_backend: memory\n"
+            "autoscale_journal_path: ''\n")
+os.chdir(_workdir)
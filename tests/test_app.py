@@ -0,0 +1,25 @@
+import pytest
+
+import app
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+@pytest.mark.parametrize('abs_from, abs_to', [
+    ('nan', '1700000000'),
+    ('1700000000', 'nan'),
+    ('-inf', '1700000000'),
+    ('1600000000', 'inf'),
+])
+def test_metrics_rejects_non_finite_window(client, abs_from, abs_to):
+    response = client.get(f'/api/metrics?abs_from={abs_from}&abs_to={abs_to}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_parse_time():
+    assert app._parse_time('1700000000.5') == 1700000000.5
+    assert app._parse_time('2023-11-14T22:13:20Z') == 1700000000
+    for value in ('nan', 'inf', '-inf', 'not a time'):
+        with pytest.raises(ValueError):
+            app._parse_time(value)
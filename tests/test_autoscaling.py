@@ -0,0 +1,49 @@
+import pytest
+
+import autoscaling
+from journal import Journal
+from state import MemoryStateBackend
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    backend = MemoryStateBackend()
+    monkeypatch.setattr(autoscaling, 'state', backend)
+    tracked = []
+    monkeypatch.setattr(autoscaling.task_tracker, 'track', lambda *args, **kwargs: tracked.append((args, kwargs)))
+    return backend, tracked
+
+def test_unfinished_task_is_resumed_after_restart(fresh_state):
+    backend, tracked = fresh_state
+    autoscaling.update_recent_action('100', {'datasetSizeInGb': 2}, 'task-1', subscription_id=1)
+    autoscaling.update_recent_action('101', {'datasetSizeInGb': 2}, subscription_id=1)  # Applied at once
+
+    assert autoscaling.resume_task_tracking() == 1
+    (args, kwargs), = tracked
+    assert args[:3] == ('task-1', '1', '100')
+    assert kwargs['created_at'] == backend.get_recent_action('100')['timestamp']
+    assert backend.get_statuses() == {'100': 'in_progress'}
+
+def test_finished_task_is_not_resumed(fresh_state):
+    backend, tracked = fresh_state
+    autoscaling.update_recent_action('100', {'datasetSizeInGb': 2}, 'task-1', subscription_id=1)
+    autoscaling._on_task_complete({'task_id': 'task-1', 'database_id': '100', 'outcome': 'done'})
+
+    assert backend.get_recent_action('100')['outcome'] == 'done'
+    assert autoscaling.resume_task_tracking() == 0
+    assert tracked == []
+
+def test_task_outcome_survives_journal_replay(fresh_state, tmp_path, monkeypatch):
+    backend, _ = fresh_state
+    journal = Journal(str(tmp_path / 'journal.log'), autoscaling._journal_snapshot)
+    journal.load()
+    monkeypatch.setattr(autoscaling, 'journal', journal)
+    autoscaling.update_recent_action('100', {'datasetSizeInGb': 2}, 'task-1', subscription_id=1)
+    autoscaling.update_recent_action('101', {'datasetSizeInGb': 2}, 'task-2', subscription_id=1)
+    autoscaling._on_task_complete({'task_id': 'task-1', 'database_id': '100', 'outcome': 'failed'})
+
+    # A restarted process rebuilds its state from the journal
+    monkeypatch.setattr(autoscaling, 'state', MemoryStateBackend())
+    autoscaling._replay_journal(Journal(journal.path, autoscaling._journal_snapshot).load())
+    assert autoscaling.state.get_recent_action('100')['outcome'] == 'failed'
+    assert autoscaling.state.get_recent_action('101')['subscription_id'] == '1'
+    assert autoscaling.resume_task_tracking() == 1
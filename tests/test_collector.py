@@ -0,0 +1,44 @@
+import json
+
+import collector
+import throughput
+
+def _database(database_id, throughput_value):
+    return {'subscription_id': 1, 'database_id': database_id, 'throughput': throughput_value}
+
+def _refresh(metrics_collector, monkeypatch, databases):
+    monkeypatch.setattr(throughput, 'get_all_metrics', lambda **kwargs: {'databases': databases})
+    return metrics_collector.refresh('5m')
+
+def test_generation_from_another_collector_gets_full_snapshot(monkeypatch):
+    # Two workers that both published generations 1 and 2 of the same period
+    worker_a = collector.MetricsCollector(60)
+    worker_b = collector.MetricsCollector(60)
+    _refresh(worker_a, monkeypatch, [_database(1, 10), _database(2, 10)])
+    _refresh(worker_b, monkeypatch, [_database(1, 10), _database(3, 10)])
+    snapshot_a = _refresh(worker_a, monkeypatch, [_database(1, 20), _database(2, 10)])
+    snapshot_b = _refresh(worker_b, monkeypatch, [_database(1, 20)])
+    assert snapshot_a.generation == snapshot_b.generation == 2
+
+    token_a = worker_a.previous_generation(snapshot_a)
+    assert token_a != worker_b.previous_generation(snapshot_b)
+    # Worker B cannot serve a delta for worker A's generation 1
+    assert worker_b.get_delta(snapshot_b, token_a) is None
+    body = json.loads(collector.snapshot_response_body(snapshot_b, delta=worker_b.get_delta(snapshot_b, token_a), since=token_a))
+    assert 'delta' not in body
+    assert body['generation'] == snapshot_b.token
+    assert [db['database_id'] for db in body['databases']] == [1]
+
+def test_delta_for_own_generation(monkeypatch):
+    worker = collector.MetricsCollector(60)
+    first = _refresh(worker, monkeypatch, [_database(1, 10), _database(2, 10)])
+    second = _refresh(worker, monkeypatch, [_database(1, 20)])
+    changed, removed = worker.get_delta(second, first.token)
+    assert [db['database_id'] for db in changed] == [1]
+    assert removed == ['1_2']
+
+def test_malformed_generation_gets_full_snapshot(monkeypatch):
+    worker = collector.MetricsCollector(60)
+    snapshot = _refresh(worker, monkeypatch, [_database(1, 10)])
+    for token in ('1', '', f'{worker.instance_id}:x', f'other:{snapshot.generation}'):
+        assert worker.get_delta(snapshot, token) is None
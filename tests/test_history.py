@@ -0,0 +1,27 @@
+import history
+
+def _round(store, db_ids, timestamp):
+    store.record({f'1_{db_id}': {metric: 1.0 for metric in history.HISTORY_METRICS} for db_id in db_ids}, timestamp)
+
+def test_series_of_the_current_round_are_never_evicted():
+    # A cap far below databases * len(HISTORY_METRICS)
+    store = history.HistoryStore(retention_seconds=3600, resolution_seconds=60, max_series=10)
+    for row in range(5):
+        _round(store, range(100), 1000 + row * 60)
+    assert store.stats()['series'] == 100 * len(history.HISTORY_METRICS)
+    assert store.stats()['rounds_over_cap'] == 5
+    timestamps, values = store.window('throughput', 0, ['1_0', '1_99'])
+    assert len(timestamps) == 5
+    assert (values == 1.0).all()
+
+def test_unset_cap_follows_the_fleet():
+    store = history.HistoryStore(retention_seconds=3600, resolution_seconds=60)
+    _round(store, range(10), 1000)
+    # A database missing from one round keeps its history
+    _round(store, range(9), 1060)
+    assert store.stats()['series'] == 10 * len(history.HISTORY_METRICS)
+    # A replaced database's series give way to the new one's
+    _round(store, list(range(9)) + [10], 1120)
+    assert store.stats()['series'] == 10 * len(history.HISTORY_METRICS)
+    assert store.query('1_9', 'throughput', 0, 2000)['series'] == []
+    assert store.stats()['rounds_over_cap'] == 0
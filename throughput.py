@@ -5,20 +5,29 @@ import yaml
 import json
 from dotenv import load_dotenv
 import re
-from datetime import datetime, timedelta
-import math
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from prometheus_async import AsyncPrometheusClient
+from query_plan import QueryPlan
+from cache import TTLCache
+import instrumentation
+import tracing
+from optimizer import ShardCatalog, optimize
+from records import DatabaseRecord, MaxScaling, MetricValues, StatusFlags
 
 load_dotenv()
 
 API_KEY = os.getenv("REDIS_CLOUD_API_KEY")
 API_SECRET = os.getenv("REDIS_CLOUD_API_SECRET")
 SUBSCRIPTION_ID = os.getenv("REDIS_CLOUD_SUBSCRIPTION_ID")
-API_URL = "https://api.redislabs.com/v1"
 
 with open('config.yaml', 'r') as f:
     config = yaml.safe_load(f)
 
+# Base URLs of the Redis Cloud API and of the console API serving shard types
+API_URL = config.get('cloud_api_url', "https://api.redislabs.com/v1")
+SHARD_TYPES_API_URL = config.get('shard_types_api_url', 'https://app.redislabs.com/api/v1')
+
 THROUGHPUT_THRESHOLD = config.get('throughput_threshold', 0.8)
 MEMORY_THRESHOLD = config.get('memory_threshold', 0.8)
 CPU_THRESHOLD = config.get('cpu_threshold', 0.6)
@@ -26,27 +35,69 @@ LATENCY_THRESHOLD_MS = config.get('latency_threshold_ms', 3)
 PAYLOAD_SIZE_THRESHOLD_KB = config.get('payload_size_threshold_kb', 3)
 PROM_SERVER_URL = config.get('prometheus_server_url', 'http://localhost:9090')
 PROM_QUERY_PERIOD = config.get('prometheus_query_period', '1h')
+PROM_QUERY_INTERVAL_SECONDS = config.get('prometheus_query_interval_seconds', 30)
+PROM_MAX_CONCURRENCY = config.get('prometheus_max_concurrency', 50)
+PROM_QUERY_TIMEOUT_SECONDS = config.get('prometheus_query_timeout_seconds', 15)
+# Overall time budget for one batch of queries; unfinished queries are returned as None
+PROM_REFRESH_DEADLINE_SECONDS = config.get('prometheus_refresh_deadline_seconds', 60)
+# Issue one query per metric/window for the whole fleet instead of one per database
+PROM_VECTORIZED_QUERIES = config.get('prometheus_vectorized_queries', True)
 CLOUD_API_QUERY_INTERVAL_SECONDS = config.get('cloud_api_query_interval_seconds', 3600)
 CLOUD_API_QUERY_INTERVAL_SECONDS_AUTOSCALE = config.get('cloud_api_query_interval_seconds_autoscale', 60)
+CLOUD_API_MAX_CONCURRENCY = config.get('cloud_api_max_concurrency', 10)
+# Record a span tree of every background refresh (served on /api/trace)
+TRACING_ENABLED = config.get('tracing_enabled', False)
+CLOUD_API_PAGE_SIZE = config.get('cloud_api_page_size', 100)
 
 # Autoscaling configuration
 MEMORY_SCALING_PERCENTAGE = config.get('memory_scaling_percentage', 20)
 THROUGHPUT_SCALING_PERCENTAGE = config.get('throughput_scaling_percentage', 20)
 
+# Local history of collected samples
+HISTORY_RETENTION_SECONDS = config.get('history_retention_seconds', 172800)
+HISTORY_RESOLUTION_SECONDS = config.get('history_resolution_seconds', 60)
+HISTORY_MAX_SERIES = config.get('history_max_series')  # None: sized from the fleet
+
+AUTOSCALE_INTERVAL_SECONDS = config.get('autoscale_interval_seconds', PROM_QUERY_INTERVAL_SECONDS)
+AUTOSCALE_MAX_WORKERS = config.get('autoscale_max_workers', 4)
+# Predictive scaling: scale up when the usage trend over the lookback crosses a threshold
+# within the horizon (a scale task takes minutes, so reacting at the threshold is late)
+AUTOSCALE_FORECAST_ENABLED = config.get('autoscale_forecast_enabled', False)
+AUTOSCALE_FORECAST_HORIZON_SECONDS = config.get('autoscale_forecast_horizon_seconds', 600)
+AUTOSCALE_FORECAST_LOOKBACK_SECONDS = config.get('autoscale_forecast_lookback_seconds', 1800)
+AUTOSCALE_FORECAST_MIN_SAMPLES = config.get('autoscale_forecast_min_samples', 5)
+# Where autoscale state is kept: 'memory' (this process only), 'sqlite' (processes on
+# one host) or 'redis' (any number of hosts)
+AUTOSCALE_STATE_BACKEND = config.get('autoscale_state_backend', 'memory')
+AUTOSCALE_STATE_PATH = config.get('autoscale_state_path', 'autoscale_state.db')
+AUTOSCALE_STATE_REDIS_URL = config.get('autoscale_state_redis_url', 'redis://localhost:6379/0')
+# Expiry of a subscription's scale lock and of the engine leader lease if their holder dies
+AUTOSCALE_LOCK_LEASE_SECONDS = config.get('autoscale_lock_lease_seconds', 120)
+# Append-only log that makes the 'memory' state backend survive restarts (empty to disable)
+AUTOSCALE_JOURNAL_PATH = config.get('autoscale_journal_path', 'autoscale_journal.log')
+AUTOSCALE_JOURNAL_FSYNC = config.get('autoscale_journal_fsync', True)
+AUTOSCALE_JOURNAL_COMPACT_AFTER = config.get('autoscale_journal_compact_after', 1000)
+
 # --- Caching for Redis API ---
-_redis_cache = {
-    'subscriptions': None,
-    'databases': {},
-    'last_fetch': None
-}
+# Entries never expire on their own; freshness is checked per read (max_age) so an
+# expired subscription can still be revalidated with its previous ETag/Last-Modified
+_subscriptions_cache = TTLCache('subscriptions', maxsize=1)  # {'all': {'subscriptions': [...], 'validators': {...}}}
+_databases_cache = TTLCache('databases', maxsize=config.get('inventory_cache_max_subscriptions', 1000))  # {subscription_id: [page, ...]}
+
+def clear_inventory_cache():
+    _subscriptions_cache.clear()
+    _databases_cache.clear()
 
 # --- Session for HTTP requests ---
 _session = None
+_session_lock = threading.Lock()
 
 def get_session():
     global _session
-    if _session is None:
-        _session = requests.Session()
+    with _session_lock:
+        if _session is not None:
+            return _session
+        session = requests.Session()
         # Configure session for better performance
         adapter = requests.adapters.HTTPAdapter(
             pool_connections=20,
@@ -54,205 +105,390 @@ def get_session():
             max_retries=3,
             pool_block=False
         )
-        _session.mount('http://', adapter)
-        _session.mount('https://', adapter)
-    return _session
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+        return _session
 
 AUTOSCALE_QUERY_PERIOD = config.get('autoscale_query_period', '5m')
 
-def is_any_autoscale_enabled():
+def get_autoscaled_subscription_ids():
+    """Subscription IDs (as strings) that have at least one autoscale-enabled database"""
     # Import here to avoid circular import
     try:
         import autoscaling
-        enabled = autoscaling.get_all_autoscale_enabled()
-        return bool(enabled)
+        return {sub_id for sub_id, _ in autoscaling.get_all_autoscale_enabled()}
     except Exception as e:
-        return False
+        return set()
 
 def get_subscriptions_cached():
-    now = datetime.utcnow()
-    # Use shorter TTL if any DB has autoscaling enabled
-    if is_any_autoscale_enabled():
-        cache_ttl = timedelta(seconds=CLOUD_API_QUERY_INTERVAL_SECONDS_AUTOSCALE)
-    else:
-        cache_ttl = timedelta(seconds=CLOUD_API_QUERY_INTERVAL_SECONDS)
-    if _redis_cache['subscriptions'] is not None and _redis_cache['last_fetch'] and now - _redis_cache['last_fetch'] < cache_ttl:
-        return _redis_cache['subscriptions']
-    subs = get_subscriptions()
-    _redis_cache['subscriptions'] = subs
-    _redis_cache['databases'] = {}  # clear DB cache on new subs fetch
-    _redis_cache['last_fetch'] = now
-    return subs
-
-def get_databases_for_subscription_cached(subscription_id):
-    now = datetime.utcnow()
-    # Use shorter TTL if any DB has autoscaling enabled
-    if is_any_autoscale_enabled():
-        cache_ttl = timedelta(seconds=CLOUD_API_QUERY_INTERVAL_SECONDS_AUTOSCALE)
+    def load():
+        previous = _subscriptions_cache.peek('all')
+        subs, validators = fetch_subscriptions(previous['validators'] if previous else None)
+        if subs is None:
+            # 304 Not Modified: the cached list is still current
+            subs = previous['subscriptions']
+        # Drop database lists of subscriptions that no longer exist; keep the rest
+        current_ids = {sub.get("id") for sub in subs}
+        for sub_id in _databases_cache.keys():
+            if sub_id not in current_ids:
+                _databases_cache.delete(sub_id)
+        return {'subscriptions': subs, 'validators': validators}
+    return _subscriptions_cache.get_or_load('all', load, max_age=CLOUD_API_QUERY_INTERVAL_SECONDS)['subscriptions']
+
+def get_databases_for_subscription_cached(subscription_id, autoscaled_ids=None):
+    """
+    Return a subscription's databases. Each subscription expires on its own:
+    after cloud_api_query_interval_seconds_autoscale if it has autoscale-enabled
+    databases, otherwise after cloud_api_query_interval_seconds. Expired entries are
+    revalidated with conditional requests, so unchanged pages cost a 304.
+    autoscaled_ids: get_autoscaled_subscription_ids(), read once per inventory pass
+    by callers that fetch many subscriptions
+    """
+    if autoscaled_ids is None:
+        autoscaled_ids = get_autoscaled_subscription_ids()
+    if str(subscription_id) in autoscaled_ids:
+        max_age = CLOUD_API_QUERY_INTERVAL_SECONDS_AUTOSCALE
     else:
-        cache_ttl = timedelta(seconds=CLOUD_API_QUERY_INTERVAL_SECONDS)
-    if (subscription_id in _redis_cache['databases'] and _redis_cache['last_fetch'] and now - _redis_cache['last_fetch'] < cache_ttl):
-        return _redis_cache['databases'][subscription_id]
-    dbs = get_databases_for_subscription(subscription_id)
-    _redis_cache['databases'][subscription_id] = dbs
-    return dbs
+        max_age = CLOUD_API_QUERY_INTERVAL_SECONDS
+    pages = _databases_cache.get_or_load(
+        subscription_id,
+        lambda: fetch_database_pages(subscription_id, _databases_cache.peek(subscription_id)),
+        max_age=max_age
+    )
+    return _flatten_pages(pages)
 
 # --- Pricing cache and fetch ---
-_pricing_cache = {
-    'pricing': {},  # {subscription_id: pricing_list}
-    'last_fetch': {},  # {subscription_id: datetime}
-}
-
 PRICING_CACHE_TTL_SECONDS = 3600  # 1 hour
 
+# Expired entries (including deleted subscriptions) are dropped on access or by LRU
+_pricing_cache = TTLCache('pricing', maxsize=1000, ttl=PRICING_CACHE_TTL_SECONDS)  # {subscription_id: pricing_list}
+
 def get_pricing_for_subscription(subscription_id):
-    now = datetime.utcnow()
-    last_fetch = _pricing_cache['last_fetch'].get(subscription_id)
-    if (
-        subscription_id in _pricing_cache['pricing']
-        and last_fetch
-        and (now - last_fetch).total_seconds() < PRICING_CACHE_TTL_SECONDS
-    ):
-        return _pricing_cache['pricing'][subscription_id]
-    url = f"{API_URL}/subscriptions/{subscription_id}/pricing"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": API_KEY,
-        "x-api-secret-key": API_SECRET
-    }
-    try:
-        response = requests.get(url, headers=headers)
+    def load():
+        url = f"{API_URL}/subscriptions/{subscription_id}/pricing"
+        headers = {
+            "accept": "application/json",
+            "x-api-key": API_KEY,
+            "x-api-secret-key": API_SECRET
+        }
+        response = instrumentation.cloud_api_request('pricing', requests.get, url, headers=headers, timeout=30)
         response.raise_for_status()
         data = response.json()
-        pricing = data.get("pricing", [])
-        _pricing_cache['pricing'][subscription_id] = pricing
-        _pricing_cache['last_fetch'][subscription_id] = now
-        return pricing
+        return data.get("pricing", [])
+    try:
+        return _pricing_cache.get_or_load(subscription_id, load)
     except Exception as e:
         return []
 
 # --- Shard Type Pricing and Unit Types Cache ---
-_shardtype_cache = {
-    'types': None,
-    'pricings': None
-}
+SHARD_TYPE_CACHE_TTL_SECONDS = config.get('shard_type_cache_ttl_seconds', 86400)  # 1 day
+
+_shardtype_cache = TTLCache('shard_types', maxsize=2, ttl=SHARD_TYPE_CACHE_TTL_SECONDS)  # {'types': [...], 'pricings': [...]}
 
 def get_shard_types():
-    if _shardtype_cache['types'] is not None:
-        return _shardtype_cache['types']
-    url = 'https://app.redislabs.com/api/v1/shardTypes'
-    resp = requests.get(url)
-    resp.raise_for_status()
-    data = resp.json()
-    _shardtype_cache['types'] = data.get('shardTypes', [])
-    return _shardtype_cache['types']
+    def load():
+        url = f'{SHARD_TYPES_API_URL}/shardTypes'
+        resp = instrumentation.cloud_api_request('shard_types', requests.get, url, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get('shardTypes', [])
+    return _shardtype_cache.get_or_load('types', load)
 
 def get_shard_type_pricings():
-    if _shardtype_cache['pricings'] is not None:
-        return _shardtype_cache['pricings']
-    url = 'https://app.redislabs.com/api/v1/shardTypePricings'
-    resp = requests.get(url)
-    resp.raise_for_status()
-    data = resp.json()
-    _shardtype_cache['pricings'] = data.get('shardTypePricings', [])
-    return _shardtype_cache['pricings']
+    def load():
+        url = f'{SHARD_TYPES_API_URL}/shardTypePricings'
+        resp = instrumentation.cloud_api_request('shard_type_pricings', requests.get, url, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get('shardTypePricings', [])
+    return _shardtype_cache.get_or_load('pricings', load)
 
 # --- Existing API functions ---
-def get_subscriptions():
-    url = f"{API_URL}/subscriptions"
+def _conditional_get(url, validators=None, endpoint='other'):
+    """
+    GET a Cloud API URL, sending If-None-Match/If-Modified-Since when validators
+    from an earlier response are given. endpoint names the request in the self-metrics.
+    returns: (JSON body or None if not modified, validators of the current version)
+    """
     headers = {
         "accept": "application/json",
         "x-api-key": API_KEY,
         "x-api-secret-key": API_SECRET
     }
+    if validators:
+        if validators.get('etag'):
+            headers["If-None-Match"] = validators['etag']
+        if validators.get('last_modified'):
+            headers["If-Modified-Since"] = validators['last_modified']
     session = get_session()
-    response = session.get(url, headers=headers, timeout=30)
+    response = instrumentation.cloud_api_request(endpoint, session.get, url, headers=headers, timeout=30)
+    if response.status_code == 304 and validators:
+        return None, validators
     response.raise_for_status()
-    data = response.json()
-    return data.get("subscriptions", [])
-
-def get_databases_for_subscription(subscription_id):
-    url = f"{API_URL}/subscriptions/{subscription_id}/databases?offset=0&limit=100"
-    headers = {
-        "accept": "application/json",
-        "x-api-key": API_KEY,
-        "x-api-secret-key": API_SECRET
+    return response.json(), {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
     }
-    session = get_session()
-    response = session.get(url, headers=headers, timeout=30)
-    response.raise_for_status()
-    data = response.json()
-    return data.get("subscription", [])[0].get("databases", [])
 
-def query_prometheus(prom_url, promql, bdb=None, cluster=None):
-    try:
-        session = get_session()
-        resp = session.get(f"{prom_url}/api/v1/query", params={"query": promql}, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        if data["status"] == "success" and data["data"]["result"]:
-            for result in data["data"]["result"]:
-                metric = result.get("metric", {})
-                if (bdb is None or metric.get("bdb") == bdb) and (cluster is None or metric.get("cluster") == cluster):
-                    return float(result["value"][1])
-            return None  # No matching result found
+def fetch_subscriptions(validators=None):
+    """
+    Fetch the subscription list, conditionally if validators are given.
+    returns: (list or None if not modified, validators of the current version)
+    """
+    data, new_validators = _conditional_get(f"{API_URL}/subscriptions", validators, 'subscriptions')
+    if data is None:
+        return None, new_validators
+    return data.get("subscriptions", []), new_validators
+
+def get_subscriptions():
+    return fetch_subscriptions()[0]
+
+def fetch_database_pages(subscription_id, cached_pages=None):
+    """
+    Fetch every page of a subscription's databases, following offset/limit
+    pagination until a short page is returned. Pages from cached_pages are
+    revalidated with conditional requests and reused when not modified.
+    returns: list of {'databases': [...], 'validators': {...}}
+    """
+    cached_pages = cached_pages or []
+    pages = []
+    seen_ids = set()
+    offset = 0
+    while True:
+        url = f"{API_URL}/subscriptions/{subscription_id}/databases?offset={offset}&limit={CLOUD_API_PAGE_SIZE}"
+        page_index = len(pages)
+        cached = cached_pages[page_index] if page_index < len(cached_pages) else None
+        data, validators = _conditional_get(url, cached['validators'] if cached else None, 'databases')
+        if data is None:
+            page = cached['databases']
         else:
-            return None
-    except Exception as e:
+            subscription = data.get("subscription") or [{}]
+            page = subscription[0].get("databases", [])
+        # Stop if the API ignores the offset and returns a page we already have
+        page = [db for db in page if db.get("databaseId") not in seen_ids]
+        seen_ids.update(db.get("databaseId") for db in page)
+        pages.append({'databases': page, 'validators': validators})
+        if len(page) < CLOUD_API_PAGE_SIZE:
+            return pages
+        offset += CLOUD_API_PAGE_SIZE
+
+def _flatten_pages(pages):
+    return [db for page in pages for db in page['databases']]
+
+def get_databases_for_subscription(subscription_id):
+    """Fetch every database of a subscription (all pages)."""
+    return _flatten_pages(fetch_database_pages(subscription_id))
+
+def _fetch_subscription_databases(subscription_id, autoscaled_ids):
+    with tracing.span('subscription_databases', subscription_id=subscription_id):
+        return get_databases_for_subscription_cached(subscription_id, autoscaled_ids)
+
+def iter_subscription_database_lists(subscriptions):
+    """
+    Fetch the databases of all subscriptions concurrently (cloud_api_max_concurrency)
+    and yield (subscription, databases) as each subscription's list arrives.
+    A subscription whose fetch fails is logged and skipped.
+    """
+    # One read of the enabled set from the state backend for the whole pass
+    autoscaled_ids = get_autoscaled_subscription_ids()
+    with ThreadPoolExecutor(max_workers=CLOUD_API_MAX_CONCURRENCY) as executor:
+        future_to_sub = {
+            executor.submit(tracing.wrap(_fetch_subscription_databases), sub.get("id"), autoscaled_ids): sub
+            for sub in subscriptions
+        }
+        for future in as_completed(future_to_sub):
+            sub = future_to_sub[future]
+            try:
+                databases = future.result()
+            except Exception as e:
+                print(f"Failed to fetch databases for subscription {sub.get('id')}: {e}")
+                continue
+            yield sub, databases or []
+
+def iter_subscription_databases(subscriptions):
+    """Yield (subscription, database) pairs as each subscription's list arrives."""
+    for sub, databases in iter_subscription_database_lists(subscriptions):
+        for db in databases:
+            yield sub, db
+
+# --- Prometheus client ---
+# Results of queries evaluated at a closed (past) time never change
+ABSOLUTE_WINDOW_SETTLE_SECONDS = config.get('absolute_window_settle_seconds', 300)
+_closed_window_cache = TTLCache('closed_windows', maxsize=config.get('absolute_window_cache_entries', 20000))
+
+_prometheus_clients = {}  # {prom_url: AsyncPrometheusClient}
+_prometheus_clients_lock = threading.Lock()
+
+def get_prometheus_client(prom_url):
+    with _prometheus_clients_lock:
+        client = _prometheus_clients.get(prom_url)
+        if client is None:
+            client = AsyncPrometheusClient(
+                prom_url,
+                max_concurrency=PROM_MAX_CONCURRENCY,
+                query_timeout=PROM_QUERY_TIMEOUT_SECONDS
+            )
+            _prometheus_clients[prom_url] = client
+        return client
+
+def _match_series(result, bdb=None, cluster=None):
+    """Return the value of the first series matching bdb/cluster, or None"""
+    for series in result or []:
+        metric = series.get("metric", {})
+        if (bdb is None or metric.get("bdb") == bdb) and (cluster is None or metric.get("cluster") == cluster):
+            return float(series["value"][1])
+    return None
+
+def _split_vector(result):
+    """Turn a result vector into {(cluster, bdb): value}"""
+    if result is None:
         return None
+    vector = {}
+    for series in result:
+        metric = series.get("metric", {})
+        vector[(metric.get("cluster", ""), metric.get("bdb"))] = float(series["value"][1])
+    return vector
+
+def query_prometheus(prom_url, promql, bdb=None, cluster=None):
+    return _match_series(get_prometheus_client(prom_url).query(promql), bdb, cluster)
 
 def query_prometheus_batch(prom_url, queries):
     """
     Batch query multiple Prometheus metrics at once
     queries: list of tuples (promql, bdb, cluster, metric_name)
-    returns: dict of {metric_name: value}
+    returns: dict of {metric_name: value}; queries unfinished at the refresh deadline are None
     """
-    results = {}
-    session = get_session()
-    
-    # Create all requests
-    requests_data = []
+    plan = QueryPlan()
     for promql, bdb, cluster, metric_name in queries:
-        requests_data.append({
-            'url': f"{prom_url}/api/v1/query",
-            'params': {"query": promql},
-            'metric_name': metric_name,
-            'bdb': bdb,
-            'cluster': cluster
-        })
-    
-    # Execute requests in parallel using ThreadPoolExecutor
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_request = {
-            executor.submit(_execute_prometheus_query, session, req): req 
-            for req in requests_data
-        }
-        
-        for future in as_completed(future_to_request):
-            request = future_to_request[future]
-            try:
-                result = future.result()
-                results[request['metric_name']] = result
-            except Exception as e:
-                results[request['metric_name']] = None
-    
-    return results
+        plan.add(metric_name, promql)
+    raw_results = plan.execute(get_prometheus_client(prom_url), deadline_seconds=PROM_REFRESH_DEADLINE_SECONDS)
+    return {
+        metric_name: _match_series(raw_results.get(metric_name), bdb, cluster)
+        for promql, bdb, cluster, metric_name in queries
+    }
 
-def _execute_prometheus_query(session, request):
-    """Helper function to execute a single Prometheus query"""
-    try:
-        resp = session.get(request['url'], params=request['params'], timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
-        if data["status"] == "success" and data["data"]["result"]:
-            for result in data["data"]["result"]:
-                metric = result.get("metric", {})
-                if (request['bdb'] is None or metric.get("bdb") == request['bdb']) and \
-                   (request['cluster'] is None or metric.get("cluster") == request['cluster']):
-                    return float(result["value"][1])
-        return None
-    except Exception as e:
-        return None
+def query_prometheus_vector(prom_url, promql):
+    """
+    Run an instant query and return the whole result vector.
+    returns: dict of {(cluster, bdb): value}, or None if the query failed
+    """
+    return _split_vector(get_prometheus_client(prom_url).query(promql))
+
+def query_prometheus_vector_batch(prom_url, queries):
+    """
+    Run several fleet-wide queries in parallel
+    queries: list of tuples (promql, name)
+    returns: dict of {name: {(cluster, bdb): value}}
+    """
+    plan = QueryPlan()
+    for promql, name in queries:
+        plan.add(name, promql)
+    raw_results = plan.execute(get_prometheus_client(prom_url), deadline_seconds=PROM_REFRESH_DEADLINE_SECONDS)
+    return _split_vectors(raw_results)
+
+def _split_vectors(raw_results):
+    """Split every distinct result of a plan once, even if several keys share it"""
+    split = {}  # {id(result): vector}
+    vectors = {}
+    for name, result in raw_results.items():
+        if id(result) not in split:
+            split[id(result)] = _split_vector(result)
+        vectors[name] = split[id(result)]
+    return vectors
+
+# Metrics collected for every database: (result suffix, Prometheus metric, window).
+# The window is 'ui' for the selected period, 'autoscale' for AUTOSCALE_QUERY_PERIOD,
+# or None to read the latest sample.
+DB_METRIC_QUERIES = [
+    # UI metrics (period_for_metrics)
+    ('throughput', 'bdb_total_req_max', 'ui'),
+    ('memory', 'bdb_used_memory', 'ui'),
+    ('cpu', 'bdb_shard_cpu_user_max', 'ui'),
+    ('latency', 'bdb_avg_latency_max', 'ui'),
+    ('ingress_bytes_max', 'bdb_ingress_bytes_max', 'ui'),
+    ('egress_bytes_max', 'bdb_egress_bytes_max', 'ui'),
+    ('throughput_max', 'bdb_total_req_max', 'ui'),
+
+    # Autoscaling metrics (period_for_autoscale)
+    ('throughput_autoscale', 'bdb_total_req_max', 'autoscale'),
+    ('memory_autoscale', 'bdb_used_memory', 'autoscale'),
+    ('cpu_autoscale', 'bdb_shard_cpu_user_max', 'autoscale'),
+    ('latency_autoscale', 'bdb_avg_latency_max', 'autoscale'),
+    ('ingress_bytes_autoscale', 'bdb_ingress_bytes_max', None),
+    ('egress_bytes_autoscale', 'bdb_egress_bytes_max', None),
+]
+
+def build_metric_query(metric, period, labels=None):
+    """
+    Build the PromQL for one metric. With labels the query selects a single database;
+    without them it covers the whole fleet, aggregated by (cluster, bdb).
+    """
+    selector = f'{metric}{{{labels}}}' if labels else metric
+    expr = f'max_over_time({selector}[{period}])' if period else selector
+    if labels:
+        return expr
+    return f'max by (cluster,bdb) ({expr})'
+
+def _eval_params(eval_time):
+    """Query params and closed-window cache for queries evaluated at eval_time"""
+    if eval_time is None:
+        return None, None
+    params = {'time': f'{eval_time:.3f}'}
+    cache = _closed_window_cache if eval_time <= time.time() - ABSOLUTE_WINDOW_SETTLE_SECONDS else None
+    return params, cache
+
+def fetch_fleet_metrics(prom_url, prom_period, autoscale_period, eval_time=None):
+    """
+    Run DB_METRIC_QUERIES once for the whole fleet. Needs no inventory, so it can
+    run while the database list is still being fetched.
+    returns: (dict of {suffix: {(cluster, bdb): value}}, query plan stats)
+    """
+    windows = {'ui': prom_period, 'autoscale': autoscale_period, None: None}
+    params, cache = _eval_params(eval_time)
+    plan = QueryPlan()
+    for suffix, metric, window in DB_METRIC_QUERIES:
+        plan.add(suffix, build_metric_query(metric, windows[window]))
+    with instrumentation.phase_timer('prometheus'):
+        raw_results = plan.execute(get_prometheus_client(prom_url), params=params, deadline_seconds=PROM_REFRESH_DEADLINE_SECONDS, cache=cache)
+    return _split_vectors(raw_results), plan.stats()
+
+def collect_db_metrics(prom_url, db_query_map, prom_period, autoscale_period, eval_time=None, fleet_metrics=None):
+    """
+    Query DB_METRIC_QUERIES for every database in db_query_map. Identical
+    expressions (e.g. when the UI and autoscale windows match) run only once.
+    With eval_time (epoch seconds) the queries are evaluated at that time instead of
+    now; results for times that are safely in the past are served from cache.
+    In vectorized mode, fleet_metrics may hold an already fetched fetch_fleet_metrics() result.
+    returns: (dict of {f'{db_key}_{suffix}': value}, query plan stats)
+    """
+    if PROM_VECTORIZED_QUERIES:
+        # One query per metric for the whole fleet, split per database in memory
+        vectors, stats = fleet_metrics or fetch_fleet_metrics(prom_url, prom_period, autoscale_period, eval_time)
+        batch_results = {}
+        for db_key, db_info in db_query_map.items():
+            series_key = (db_info['cluster_label'], db_info['bdb'])
+            for suffix, _, _ in DB_METRIC_QUERIES:
+                vector = vectors.get(suffix) or {}
+                batch_results[f'{db_key}_{suffix}'] = vector.get(series_key)
+        return batch_results, stats
+
+    windows = {'ui': prom_period, 'autoscale': autoscale_period, None: None}
+    params, cache = _eval_params(eval_time)
+    plan = QueryPlan()
+    series = {}  # {result key: (bdb, cluster_label)}
+    for db_key, db_info in db_query_map.items():
+        bdb = db_info['bdb']
+        cluster_label = db_info['cluster_label']
+        labels = f'cluster="{cluster_label}",bdb="{bdb}"'
+        for suffix, metric, window in DB_METRIC_QUERIES:
+            key = f'{db_key}_{suffix}'
+            plan.add(key, build_metric_query(metric, windows[window], labels))
+            series[key] = (bdb, cluster_label)
+    with instrumentation.phase_timer('prometheus'):
+        raw_results = plan.execute(get_prometheus_client(prom_url), params=params, deadline_seconds=PROM_REFRESH_DEADLINE_SECONDS, cache=cache)
+    batch_results = {key: _match_series(result, *series[key]) for key, result in raw_results.items()}
+    return batch_results, plan.stats()
 
 def get_metric_from_metrics_text(metrics_text, metric_name, labels):
     # Match the metric line and capture the label block and value
@@ -327,15 +563,15 @@ def get_metrics_for_db(cluster_label, db, thresholds, subscription_name, period)
     mem_limit_gb = db.get("memoryLimitInGb", 0)
     throughput_limit = db.get("throughputMeasurement", {}).get("value", 0)
     # Only set static/config data, no Prometheus queries
-    metrics = {
-        "throughput": None,
-        "throughput_limit": throughput_limit,
-        "memory": None,
-        "memory_limit_bytes": mem_limit_gb * 1024 * 1024 * 1024,
-        "cpu": None,
-        "latency_ms": None,
-        "payload_size_bytes": None
-    }
+    metrics = MetricValues(
+        throughput=None,
+        throughput_limit=throughput_limit,
+        memory=None,
+        memory_limit_bytes=mem_limit_gb * 1024 * 1024 * 1024,
+        cpu=None,
+        latency_ms=None,
+        payload_size_bytes=None
+    )
     # Calculate status (all will be None, so all will be False)
     throughput_ok = False
     memory_ok = False
@@ -348,28 +584,28 @@ def get_metrics_for_db(cluster_label, db, thresholds, subscription_name, period)
     replication = db.get("replication", False)
     max_throughput = num_shards * 25000  # 25K ops/sec per shard
     max_memory_gb = num_shards * 25 * (2 if replication else 1)  # 25GB per shard, doubled if replication
-    result = {
-        "subscription_id": cluster,
-        "subscription_name": subscription_name,
-        "database_id": bdb,
-        "database_name": db.get("name"),
-        "metrics": metrics,
-        "thresholds": thresholds,
-        "status": {
-            "throughput_ok": throughput_ok,
-            "memory_ok": memory_ok,
-            "cpu_ok": cpu_ok,
-            "latency_ok": latency_ok,
-            "payload_size_ok": payload_size_ok
-        },
-        "max_scaling": {
-            "memory_gb": max_memory_gb,
-            "throughput_ops": max_throughput
-        },
-        "downscale_memory_mb": None,
-        "downscale_throughput_ops": None,
-        "downscale_price_suggestion": None
-    }
+    result = DatabaseRecord(
+        subscription_id=cluster,
+        subscription_name=subscription_name,
+        database_id=bdb,
+        database_name=db.get("name"),
+        metrics=metrics,
+        thresholds=thresholds,
+        status=StatusFlags(
+            throughput_ok=throughput_ok,
+            memory_ok=memory_ok,
+            cpu_ok=cpu_ok,
+            latency_ok=latency_ok,
+            payload_size_ok=payload_size_ok
+        ),
+        max_scaling=MaxScaling(
+            memory_gb=max_memory_gb,
+            throughput_ops=max_throughput
+        ),
+        downscale_memory_mb=None,
+        downscale_throughput_ops=None,
+        downscale_price_suggestion=None
+    )
     return result
 
 def nice_memory_step(usage_bytes):
@@ -445,125 +681,213 @@ def nice_throughput_step(usage_ops):
     
     return suggested
 
-def get_best_downscale_price(region, cloud, memory_mb, throughput_ops, ha_enabled):
+PRICE_MEMO_MAX_ENTRIES = 4096
+DOWNSCALE_PRICE_ALTERNATIVES = config.get('downscale_price_alternatives', 3)
+
+_pricing_index = {'types': None, 'pricings': None, 'index': None, 'memo': None}
+_pricing_index_lock = threading.Lock()
+
+def get_pricing_index():
+    """
+    Shard types with their prices, grouped by where they are sold, plus the memo of
+    optimizer results computed from them. Rebuilt only when the shard type or shard
+    type pricing data is reloaded.
+    returns: ({(region, cloud): ShardCatalog}, memo dict)
+    """
     shard_types = get_shard_types()
     pricings = get_shard_type_pricings()
+    with _pricing_index_lock:
+        if _pricing_index['types'] is shard_types and _pricing_index['pricings'] is pricings:
+            return _pricing_index['index'], _pricing_index['memo']
+        types_by_id = {}
+        for st in shard_types:
+            st_mem_gb = st.get('memory_size_gb')
+            st_thr = st.get('throughput')
+            if not st_mem_gb or not st_thr:
+                continue
+            types_by_id[st.get('id')] = (st.get('name'), st_mem_gb * 1024, st_thr)  # Convert GB to MB
+        index = {}
+        for p in pricings:
+            shard_type = types_by_id.get(p['shard_type_id'])
+            if shard_type is None:
+                continue
+            index.setdefault((p['region_name'], p['cloud_name']), []).append(shard_type + (p['price'],))
+        index = {location: ShardCatalog(types) for location, types in index.items()}
+        _pricing_index.update(types=shard_types, pricings=pricings, index=index, memo={})
+        return index, _pricing_index['memo']
+
+def get_best_downscale_price(region, cloud, memory_mb, throughput_ops, ha_enabled):
+    """
+    Cheapest shard configuration that covers memory_mb and throughput_ops, with the next
+    cheapest ones as 'alternatives'. Memoized per (region, cloud, memory_mb, throughput_ops, ha):
+    nice_memory_step/nice_throughput_step produce few distinct inputs across the fleet.
+    """
+    index, memo = get_pricing_index()
+    key = (region, cloud, memory_mb, throughput_ops, bool(ha_enabled))
+    if key in memo:
+        best = memo[key]
+        return dict(best) if best else None
     best = None
-    for st in shard_types:
-        st_id = st.get('id')
-        st_name = st.get('name')
-        st_mem_gb = st.get('memory_size_gb')
-        st_thr = st.get('throughput')
-        st_mem_mb = st_mem_gb * 1024 if st_mem_gb else None  # Convert GB to MB
-        if not st_mem_mb or not st_thr:
-            continue
-        units_needed = max(
-            math.ceil(memory_mb / st_mem_mb),
-            math.ceil(throughput_ops / st_thr)
-        )
-        # Find price for this unit type in the right region/cloud
-        price_entry = next((p for p in pricings if p['shard_type_id'] == st_id and p['region_name'] == region and p['cloud_name'] == cloud), None)
-        if not price_entry:
-            continue
-        price_per_unit = price_entry['price']
-        total_price = price_per_unit * units_needed
-        if ha_enabled:
-            total_price *= 2
-        if best is None or total_price < best['price']:
-            best = {
-                'price': round(total_price, 4),
-                'unit_type': st_name,
-                'units_needed': units_needed
-            }
-    return best
+    catalog = index.get((region, cloud))
+    configurations = optimize(catalog, memory_mb, throughput_ops, ha_enabled, top_k=DOWNSCALE_PRICE_ALTERNATIVES) if catalog else []
+    if configurations:
+        cheapest = configurations[0]
+        parts = cheapest['configuration']
+        best = {
+            'price': cheapest['price'],
+            'unit_type': ' + '.join(part['unit_type'] for part in parts),
+            'units_needed': sum(part['units'] for part in parts),
+            'configuration': parts,
+            'alternatives': configurations[1:]
+        }
+    if len(memo) >= PRICE_MEMO_MAX_ENTRIES:
+        memo.clear()
+    memo[key] = best
+    return dict(best) if best else None
+
+def get_cluster_label(db):
+    """Prometheus `cluster` label of a database, taken from its private endpoint if not set"""
+    cluster_label = db.get("cluster", None)
+    if not cluster_label:
+        private_endpoint = db.get("privateEndpoint", "")
+        if ".internal." in private_endpoint:
+            cluster_label = private_endpoint.split(".internal.", 1)[1].split(":")[0]
+        else:
+            cluster_label = ""
+    return cluster_label
+
+def get_database_cloud(sub, db):
+    # Get cloud provider from subscription cloudDetails
+    cloud = None
+    if sub.get('cloudDetails') and len(sub['cloudDetails']) > 0:
+        cloud = sub['cloudDetails'][0].get('provider')
+    # Fallback to database provider if not found in subscription
+    if not cloud:
+        cloud = db.get('provider') or db.get('cloudProvider') or db.get('cloud')
+    return cloud
+
+def get_current_price(db, pricing_list):
+    """
+    Current hourly price of a database from its subscription's pricing list.
+    returns: (price_hourly, min_subscription_price), either may be None
+    """
+    price_hourly = None
+    min_subscription_price = None
+    db_type = db.get("typeDetails") or db.get("type")
+    db_shards = db.get("clustering", {}).get("numberOfShards", 1)
+    
+    # Find matching Shards entry in pricing_list (ignore pricePeriod)
+    price_entry = None
+    for entry in pricing_list:
+        if (
+            entry.get("type") == "Shards"
+            and (entry.get("typeDetails") == db_type or not db_type)
+            and entry.get("quantity") == db_shards
+        ):
+            price_entry = entry
+            break
+    
+    # Fallback: use first Shards entry if no exact match
+    if price_entry is None:
+        for entry in pricing_list:
+            if entry.get("type") == "Shards":
+                price_entry = entry
+                break
+    
+    if price_entry:
+        per_unit = price_entry.get("pricePerUnit")
+        quantity = price_entry.get("quantity", db_shards)
+        if per_unit is not None:
+            price_hourly = quantity * per_unit
+    
+    # Find MinimumPrice entry in pricing_list (ignore pricePeriod)
+    for entry in pricing_list:
+        if entry.get("type") == "MinimumPrice":
+            min_subscription_price = entry.get("pricePerUnit")
+            break
+    return price_hourly, min_subscription_price
 
-def get_all_metrics(period=None):
+def get_all_metrics(period=None, abs_from=None, abs_to=None):
+    """
+    Collect metrics for every database. period is a lookback window ending now;
+    abs_from/abs_to (epoch seconds) select an absolute window instead, in which case
+    every query, including the autoscale window, is evaluated at abs_to.
+    """
     prom_period = period if period else '5m'
     autoscale_period = AUTOSCALE_QUERY_PERIOD
-    subscriptions = get_subscriptions_cached()
-    thresholds = {
-        "throughput_threshold": THROUGHPUT_THRESHOLD,
-        "memory_threshold": MEMORY_THRESHOLD,
-        "cpu_threshold": CPU_THRESHOLD,
-        "latency_threshold_ms": LATENCY_THRESHOLD_MS,
-        "payload_size_threshold_kb": PAYLOAD_SIZE_THRESHOLD_KB
-    }
-    results = []
+    eval_time = None
+    if abs_from is not None and abs_to is not None:
+        prom_period = f'{max(1, int(round(abs_to - abs_from)))}s'
+        eval_time = abs_to
+    # Fleet-wide queries don't depend on the inventory, so start them right away
+    prefetch = ThreadPoolExecutor(max_workers=1)
+    try:
+        fleet_future = None
+        if PROM_VECTORIZED_QUERIES:
+            fleet_future = prefetch.submit(tracing.wrap(fetch_fleet_metrics), PROM_SERVER_URL, prom_period, autoscale_period, eval_time)
     
-    # Collect all databases first
-    all_databases = []
-    for sub in subscriptions:
-        sub_id = sub.get("id")
-        sub_name = sub.get("name")
-        databases = get_databases_for_subscription_cached(sub_id)
-        if not databases:
-            continue
-        for db in databases:
-            if db.get("activeActiveRedis") and db.get("crdbDatabases"):
-                continue
-            all_databases.append((sub, db))
+        inventory_started = time.perf_counter()
+        inventory_span = tracing.begin('inventory')
+        subscriptions = get_subscriptions_cached()
+        thresholds = {
+            "throughput_threshold": THROUGHPUT_THRESHOLD,
+            "memory_threshold": MEMORY_THRESHOLD,
+            "cpu_threshold": CPU_THRESHOLD,
+            "latency_threshold_ms": LATENCY_THRESHOLD_MS,
+            "payload_size_threshold_kb": PAYLOAD_SIZE_THRESHOLD_KB
+        }
+        results = []
     
-    # Batch collect all Prometheus queries
-    all_queries = []
-    db_query_map = {}  # Map to track which queries belong to which database
+        db_query_map = {}  # Map to track which database each result belongs to
     
-    for sub, db in all_databases:
-        sub_id = sub.get("id")
-        sub_name = sub.get("name")
-        db0 = db
-        cluster_label = db0.get("cluster", None)
-        if not cluster_label:
-            private_endpoint = db0.get("privateEndpoint", "")
-            if ".internal." in private_endpoint:
-                cluster_label = private_endpoint.split(".internal.", 1)[1].split(":")[0]
-            else:
-                cluster_label = ""
-        
-        bdb = str(db.get("databaseId"))
-        cluster = db.get("subscriptionId")
-        labels = f'cluster="{cluster_label}",bdb="{bdb}"'
+        # Databases stream in as each subscription's list arrives
+        for sub, db in iter_subscription_databases(subscriptions):
+            if db.get("activeActiveRedis") and db.get("crdbDatabases"):
+                continue
+            sub_id = sub.get("id")
+            sub_name = sub.get("name")
+            cluster_label = get_cluster_label(db)
         
-        # Create unique identifier for this database
-        db_key = f"{sub_id}_{bdb}"
-        db_query_map[db_key] = {
-            'sub': sub,
-            'db': db,
-            'cluster_label': cluster_label,
-            'bdb': bdb,
-            'cluster': cluster,
-            'sub_name': sub_name
-        }
+            bdb = str(db.get("databaseId"))
+            cluster = db.get("subscriptionId")
         
-        # Add all queries for this database
-        queries = [
-            # UI metrics (period_for_metrics)
-            (f'max_over_time(bdb_total_req_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_throughput'),
-            (f'max_over_time(bdb_used_memory{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_memory'),
-            (f'max_over_time(bdb_shard_cpu_user_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_cpu'),
-            (f'max_over_time(bdb_avg_latency_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_latency'),
-            (f'max_over_time(bdb_ingress_bytes_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_ingress_bytes_max'),
-            (f'max_over_time(bdb_egress_bytes_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_egress_bytes_max'),
-            (f'max_over_time(bdb_total_req_max{{{labels}}}[{prom_period}])', bdb, cluster_label, f'{db_key}_throughput_max'),
-            
-            # Autoscaling metrics (period_for_autoscale)
-            (f'max_over_time(bdb_total_req_max{{{labels}}}[{autoscale_period}])', bdb, cluster_label, f'{db_key}_throughput_autoscale'),
-            (f'max_over_time(bdb_used_memory{{{labels}}}[{autoscale_period}])', bdb, cluster_label, f'{db_key}_memory_autoscale'),
-            (f'max_over_time(bdb_shard_cpu_user_max{{{labels}}}[{autoscale_period}])', bdb, cluster_label, f'{db_key}_cpu_autoscale'),
-            (f'max_over_time(bdb_avg_latency_max{{{labels}}}[{autoscale_period}])', bdb, cluster_label, f'{db_key}_latency_autoscale'),
-            (f'bdb_ingress_bytes_max{{{labels}}}', bdb, cluster_label, f'{db_key}_ingress_bytes_autoscale'),
-            (f'bdb_egress_bytes_max{{{labels}}}', bdb, cluster_label, f'{db_key}_egress_bytes_autoscale'),
-        ]
-        all_queries.extend(queries)
+            # Create unique identifier for this database
+            db_key = f"{sub_id}_{bdb}"
+            db_query_map[db_key] = {
+                'sub': sub,
+                'db': db,
+                'cluster_label': cluster_label,
+                'bdb': bdb,
+                'cluster': cluster,
+                'sub_name': sub_name
+            }
+    
+        inventory_span.end()
+        instrumentation.PHASE_DURATION.labels('inventory').observe(time.perf_counter() - inventory_started)
+    
+        # Keep the subscription order stable regardless of which fetch finished first
+        sub_order = {sub.get("id"): index for index, sub in enumerate(subscriptions)}
+        db_query_map = dict(sorted(db_query_map.items(), key=lambda item: sub_order.get(item[1]['sub'].get("id"), 0)))
     
-    # Execute all queries in parallel
-    batch_results = query_prometheus_batch(PROM_SERVER_URL, all_queries)
+        # Execute all queries in parallel
+        fleet_metrics = fleet_future.result() if fleet_future else None
+    finally:
+        # Also when the inventory fetch fails (e.g. a Cloud API outage), which the
+        # collector retries every interval
+        prefetch.shutdown(wait=False, cancel_futures=True)
+    batch_results, query_stats = collect_db_metrics(PROM_SERVER_URL, db_query_map, prom_period, autoscale_period, eval_time, fleet_metrics)
     
-    # Process results for each database
+    # Process results for each database; time spent pricing is reported separately
+    processing_started = time.perf_counter()
+    processing_span = tracing.begin('processing')
+    pricing_seconds = 0.0
     for db_key, db_info in db_query_map.items():
         sub = db_info['sub']
+        sub_id = sub.get("id")
         db = db_info['db']
         cluster_label = db_info['cluster_label']
         bdb = db_info['bdb']
+        db_span = tracing.begin('database', subscription_id=sub_id, database_id=bdb)
         cluster = db_info['cluster']
         sub_name = db_info['sub_name']
         
@@ -602,41 +926,44 @@ def get_all_metrics(period=None):
         
         # Use subscriptionPricing if present
         subscription_pricing = sub.get("subscriptionPricing", [])
-        pricing_list = subscription_pricing if subscription_pricing else get_pricing_for_subscription(cluster)
+        pricing_started = time.perf_counter()
+        with tracing.span('pricing'):
+            pricing_list = subscription_pricing if subscription_pricing else get_pricing_for_subscription(cluster)
+        pricing_seconds += time.perf_counter() - pricing_started
         
         try:
-            metrics_result = {
-                "subscription_id": cluster,
-                "subscription_name": sub_name,
-                "database_id": bdb,
-                "database_name": db.get("name"),
-                "metrics": {
-                    "throughput": throughput,
-                    "throughput_limit": throughput_limit,
-                    "memory": memory,
-                    "memory_limit_bytes": mem_limit_gb * 1024 * 1024 * 1024,
-                    "cpu": cpu,
-                    "latency_ms": latency,
-                    "payload_size_bytes": payload_size
-                },
-                "metrics_autoscale": {
-                    "throughput": throughput_autoscale,
-                    "throughput_limit": throughput_limit,
-                    "memory": memory_autoscale,
-                    "memory_limit_bytes": mem_limit_gb * 1024 * 1024 * 1024,
-                    "cpu": cpu_autoscale,
-                    "latency_ms": latency_autoscale,
-                    "payload_size_bytes": payload_size_autoscale
-                },
-                "thresholds": thresholds,
-                "status": {
-                    "throughput_ok": throughput is not None and throughput < thresholds["throughput_threshold"] * throughput_limit,
-                    "memory_ok": memory is not None and memory < thresholds["memory_threshold"] * mem_limit_gb * 1024 * 1024 * 1024,
-                    "cpu_ok": cpu is not None and cpu < thresholds["cpu_threshold"] * 100,
-                    "latency_ok": latency is None or latency < thresholds["latency_threshold_ms"],
-                    "payload_size_ok": payload_size is None or payload_size < thresholds.get("payload_size_threshold_kb", 1024) * 1024
-                }
-            }
+            metrics_result = DatabaseRecord(
+                subscription_id=cluster,
+                subscription_name=sub_name,
+                database_id=bdb,
+                database_name=db.get("name"),
+                metrics=MetricValues(
+                    throughput=throughput,
+                    throughput_limit=throughput_limit,
+                    memory=memory,
+                    memory_limit_bytes=mem_limit_gb * 1024 * 1024 * 1024,
+                    cpu=cpu,
+                    latency_ms=latency,
+                    payload_size_bytes=payload_size
+                ),
+                metrics_autoscale=MetricValues(
+                    throughput=throughput_autoscale,
+                    throughput_limit=throughput_limit,
+                    memory=memory_autoscale,
+                    memory_limit_bytes=mem_limit_gb * 1024 * 1024 * 1024,
+                    cpu=cpu_autoscale,
+                    latency_ms=latency_autoscale,
+                    payload_size_bytes=payload_size_autoscale
+                ),
+                thresholds=thresholds,
+                status=StatusFlags(
+                    throughput_ok=throughput is not None and throughput < thresholds["throughput_threshold"] * throughput_limit,
+                    memory_ok=memory is not None and memory < thresholds["memory_threshold"] * mem_limit_gb * 1024 * 1024 * 1024,
+                    cpu_ok=cpu is not None and cpu < thresholds["cpu_threshold"] * 100,
+                    latency_ok=latency is None or latency < thresholds["latency_threshold_ms"],
+                    payload_size_ok=payload_size is None or payload_size < thresholds.get("payload_size_threshold_kb", 1024) * 1024
+                )
+            )
             
             # Add max_scaling calculation
             clustering = db.get("clustering", {})
@@ -644,18 +971,18 @@ def get_all_metrics(period=None):
             replication = db.get("replication", False)
             max_throughput = num_shards * 25000  # 25K ops/sec per shard
             max_memory_gb = num_shards * 25 * (2 if replication else 1)  # 25GB per shard, doubled if replication
-            metrics_result["max_scaling"] = {
-                "memory_gb": max_memory_gb,
-                "throughput_ops": max_throughput
-            }
+            metrics_result["max_scaling"] = MaxScaling(
+                memory_gb=max_memory_gb,
+                throughput_ops=max_throughput
+            )
             
             # Downscale suggestion logic (use max_over_time for memory and throughput)
             downscale_memory_mb = None
             downscale_throughput_ops = None
             if metrics_result['status']['throughput_ok'] and metrics_result['status']['memory_ok'] and metrics_result['status']['cpu_ok'] and metrics_result['status']['latency_ok'] and metrics_result['status']['payload_size_ok']:
-                # Use max_over_time for the period for safe downscale
-                mem_used = query_prometheus(PROM_SERVER_URL, f'max_over_time(bdb_used_memory{{{labels}}}[{prom_period}])', bdb=bdb, cluster=cluster_label) or 0
-                thr_used = query_prometheus(PROM_SERVER_URL, f'max_over_time(bdb_total_req_max{{{labels}}}[{prom_period}])', bdb=bdb, cluster=cluster_label) or 0
+                # Peak memory and ops over the period (max_over_time) come from the batch results
+                mem_used = memory or 0
+                thr_used = throughput_max or 0
                 downscale_memory_mb = nice_memory_step(mem_used)
                 downscale_throughput_ops = nice_throughput_step(thr_used)
             metrics_result['downscale_memory_mb'] = downscale_memory_mb
@@ -664,53 +991,18 @@ def get_all_metrics(period=None):
             downscale_price_suggestion = None
             if downscale_memory_mb and downscale_throughput_ops:
                 region = db.get('region')
-                # Get cloud provider from subscription cloudDetails
-                cloud = None
-                if sub.get('cloudDetails') and len(sub['cloudDetails']) > 0:
-                    cloud = sub['cloudDetails'][0].get('provider')
-                # Fallback to database provider if not found in subscription
-                if not cloud:
-                    cloud = db.get('provider') or db.get('cloudProvider') or db.get('cloud')
+                cloud = get_database_cloud(sub, db)
                 ha_enabled = db.get('replication', False)
-                downscale_price_suggestion = get_best_downscale_price(region, cloud, downscale_memory_mb, downscale_throughput_ops, ha_enabled)
+                pricing_started = time.perf_counter()
+                with tracing.span('pricing'):
+                    downscale_price_suggestion = get_best_downscale_price(region, cloud, downscale_memory_mb, downscale_throughput_ops, ha_enabled)
+                pricing_seconds += time.perf_counter() - pricing_started
             metrics_result['downscale_price_suggestion'] = downscale_price_suggestion
             
-            # --- Price mapping logic ---
-            price_hourly = None
-            min_subscription_price = None
-            db_type = db.get("typeDetails") or db.get("type")
-            db_shards = db.get("clustering", {}).get("numberOfShards", 1)
-            
-            # Find matching Shards entry in pricing_list (ignore pricePeriod)
-            price_entry = None
-            for entry in pricing_list:
-                if (
-                    entry.get("type") == "Shards"
-                    and (entry.get("typeDetails") == db_type or not db_type)
-                    and entry.get("quantity") == db_shards
-                ):
-                    price_entry = entry
-                    break
-            
-            # Fallback: use first Shards entry if no exact match
-            if price_entry is None:
-                for entry in pricing_list:
-                    if entry.get("type") == "Shards":
-                        price_entry = entry
-                        break
-            
-            if price_entry:
-                per_unit = price_entry.get("pricePerUnit")
-                quantity = price_entry.get("quantity", db_shards)
-                if per_unit is not None:
-                    price_hourly = quantity * per_unit
-            
-            # Find MinimumPrice entry in pricing_list (ignore pricePeriod)
-            for entry in pricing_list:
-                if entry.get("type") == "MinimumPrice":
-                    min_subscription_price = entry.get("pricePerUnit")
-                    break
-            
+            pricing_started = time.perf_counter()
+            with tracing.span('pricing'):
+                price_hourly, min_subscription_price = get_current_price(db, pricing_list)
+            pricing_seconds += time.perf_counter() - pricing_started
             metrics_result["price_hourly"] = price_hourly
             metrics_result["min_subscription_price"] = min_subscription_price
             result = metrics_result
@@ -723,7 +1015,11 @@ def get_all_metrics(period=None):
         except Exception as e:
             metrics_result = get_metrics_for_db(cluster_label, db, thresholds, sub_name, prom_period)
             results.append(metrics_result)
-    return {"databases": results}
+        db_span.end()
+    processing_span.end()
+    instrumentation.PHASE_DURATION.labels('pricing').observe(pricing_seconds)
+    instrumentation.PHASE_DURATION.labels('processing').observe(time.perf_counter() - processing_started - pricing_seconds)
+    return {"databases": results, "query_stats": query_stats}
 
 if __name__ == '__main__':
     subscriptions = get_subscriptions()
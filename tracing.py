@@ -0,0 +1,173 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    __slots__ = ('trace', 'name', 'attrs', 'parent', 'children', 'start', 'end')
+
+    def __init__(self, trace, name, attrs, parent):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        return ((self.end if self.end is not None else time.perf_counter()) - self.start)
+
+    def path(self):
+        names = []
+        span = self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return ';'.join(reversed(names))
+
+class Trace:
+    """
+    Spans recorded for one traced operation. Spans may be opened from several threads;
+    concurrent children of one span overlap, so their durations can add up to more
+    than the parent's.
+    """
+
+    def __init__(self, name, max_spans=50000):
+        self.max_spans = max_spans
+        self.dropped = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.root = Span(self, name, {}, None)
+
+    def _add(self, name, attrs, parent):
+        span = Span(self, name, attrs, parent)
+        with self._lock:
+            if self._count >= self.max_spans:
+                self.dropped += 1
+                return None
+            self._count += 1
+            parent.children.append(span)
+        return span
+
+    def _walk(self):
+        stack = [self.root]
+        while stack:
+            span = stack.pop()
+            yield span
+            with self._lock:
+                stack.extend(reversed(span.children))
+
+    def breakdown(self):
+        """
+        Time per span path (e.g. 'refresh;inventory;cloud_api:databases'), slowest first.
+        self_ms excludes time spent in child spans.
+        """
+        totals = {}
+        for span in self._walk():
+            path = span.path()
+            duration = span.duration
+            child_time = sum(child.duration for child in span.children)
+            entry = totals.setdefault(path, {'path': path, 'count': 0, 'total_ms': 0.0, 'self_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += duration * 1000
+            entry['self_ms'] += max(0.0, duration - child_time) * 1000
+        rows = sorted(totals.values(), key=lambda row: row['total_ms'], reverse=True)
+        for row in rows:
+            row['total_ms'] = round(row['total_ms'], 3)
+            row['self_ms'] = round(row['self_ms'], 3)
+        return {
+            'name': self.root.name,
+            'duration_ms': round(self.root.duration * 1000, 3),
+            'spans': self._count + 1,
+            'dropped_spans': self.dropped,
+            'breakdown': rows
+        }
+
+    def spans(self, min_ms=0):
+        """Every span as {'path', 'start_ms', 'duration_ms', 'attrs'}, relative to the trace start"""
+        return [
+            {
+                'path': span.path(),
+                'start_ms': round((span.start - self.root.start) * 1000, 3),
+                'duration_ms': round(span.duration * 1000, 3),
+                'attrs': span.attrs
+            }
+            for span in self._walk() if span.duration * 1000 >= min_ms
+        ]
+
+    def folded(self):
+        """
+        Folded stacks ('a;b;c <microseconds>' per line) of self time, the input format of
+        flamegraph.pl, speedscope and similar tools.
+        """
+        totals = {}
+        for span in self._walk():
+            child_time = sum(child.duration for child in span.children)
+            self_us = int(max(0.0, span.duration - child_time) * 1_000_000)
+            path = span.path()
+            totals[path] = totals.get(path, 0) + self_us
+        return '\n'.join(f'{path} {value}' for path, value in totals.items() if value > 0) + '\n'
+
+@contextmanager
+def start_trace(name):
+    """Trace everything under this block (in this thread and in work propagated with wrap())."""
+    trace = Trace(name)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace
+    finally:
+        trace.root.end = time.perf_counter()
+        _current_span.reset(token)
+
+class _ActiveSpan:
+    """Handle of a span opened with begin(); end() closes it and restores the previous span."""
+    __slots__ = ('span', '_token')
+
+    def __init__(self, span, token):
+        self.span = span
+        self._token = token
+
+    def end(self):
+        if self.span is None:
+            return
+        self.span.end = time.perf_counter()
+        _current_span.reset(self._token)
+        self.span = None
+
+_NOOP = _ActiveSpan(None, None)
+
+def begin(name, parent=None, **attrs):
+    """
+    Open a span under the current span (or parent) and make it current until end().
+    Does nothing outside a trace, so instrumented code costs one context variable
+    lookup when tracing is off.
+    """
+    parent = parent if parent is not None else _current_span.get()
+    if parent is None:
+        return _NOOP
+    current = parent.trace._add(name, attrs, parent)
+    if current is None:
+        return _NOOP
+    return _ActiveSpan(current, _current_span.set(current))
+
+@contextmanager
+def span(name, parent=None, **attrs):
+    """Record the enclosed block as a span (see begin())."""
+    active = begin(name, parent, **attrs)
+    try:
+        yield active.span
+    finally:
+        active.end()
+
+def current_span():
+    """The active span, to pass as parent= to work running outside this context (e.g. an event loop)."""
+    return _current_span.get()
+
+def wrap(fn):
+    """Bind fn to the current tracing context, for running it on another thread (executor.submit)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,139 @@
+import json
+
+import throughput
+from cache import TTLCache
+from history import parse_duration
+from query_plan import QueryPlan
+
+HA_POLICIES = ('keep', 'on', 'off')
+
+# Long-range quantile queries are expensive; scenarios re-run with other HA policies reuse them
+_usage_cache = TTLCache('what_if_usage', maxsize=32, ttl=300)  # {(quantile, lookback): {name: vector}}
+
+# (name, Prometheus metric) of the usage a database is right-sized to
+USAGE_METRICS = [
+    ('memory', 'bdb_used_memory'),
+    ('throughput', 'bdb_total_req_max'),
+]
+
+def parse_scenario(params):
+    """
+    Validate what-if scenario parameters.
+    params: dict with optional 'quantile' (0 < q <= 1, default 0.99), 'lookback'
+    (duration, default '7d') and 'ha' ('keep', 'on' or 'off', default 'keep')
+    returns: scenario dict; raises ValueError on invalid input
+    """
+    quantile = float(params.get('quantile', 0.99))
+    if not 0 < quantile <= 1:
+        raise ValueError('quantile must be in (0, 1]')
+    lookback = str(params.get('lookback', '7d'))
+    parse_duration(lookback)
+    ha = params.get('ha', 'keep')
+    if ha not in HA_POLICIES:
+        raise ValueError(f"ha must be one of {', '.join(HA_POLICIES)}")
+    return {'quantile': quantile, 'lookback': lookback, 'ha': ha}
+
+def build_usage_query(metric, quantile, lookback):
+    """Fleet-wide usage at the given quantile over lookback; quantile 1 is the peak."""
+    if quantile >= 1:
+        return throughput.build_metric_query(metric, lookback)
+    return f'max by (cluster,bdb) (quantile_over_time({quantile:g}, {metric}[{lookback}]))'
+
+def fetch_usage(quantile, lookback):
+    """
+    returns: dict of {name: {(cluster, bdb): value}} for USAGE_METRICS
+    """
+    def load():
+        plan = QueryPlan()
+        for name, metric in USAGE_METRICS:
+            plan.add(name, build_usage_query(metric, quantile, lookback))
+        client = throughput.get_prometheus_client(throughput.PROM_SERVER_URL)
+        raw_results = plan.execute(client, deadline_seconds=throughput.PROM_REFRESH_DEADLINE_SECONDS)
+        if any(result is None for result in raw_results.values()):
+            raise RuntimeError(f'Usage queries for quantile {quantile:g} over {lookback} failed')
+        return throughput._split_vectors(raw_results)
+    return _usage_cache.get_or_load((quantile, lookback), load)
+
+def simulate_database(sub, db, usage, scenario, pricing_list):
+    """Current and projected hourly price of one database under the scenario"""
+    series_key = (throughput.get_cluster_label(db), str(db.get("databaseId")))
+    memory = (usage.get('memory') or {}).get(series_key)
+    ops = (usage.get('throughput') or {}).get(series_key)
+    if scenario['ha'] == 'keep':
+        ha_enabled = bool(db.get('replication', False))
+    else:
+        ha_enabled = scenario['ha'] == 'on'
+    current_price, _ = throughput.get_current_price(db, pricing_list)
+
+    target = None
+    suggestion = None
+    if memory is not None and ops is not None:
+        target = {
+            'memory_mb': throughput.nice_memory_step(memory),
+            'throughput_ops': throughput.nice_throughput_step(ops),
+            'ha': ha_enabled
+        }
+        suggestion = throughput.get_best_downscale_price(
+            db.get('region'), throughput.get_database_cloud(sub, db),
+            target['memory_mb'], target['throughput_ops'], ha_enabled
+        )
+    return {
+        'database_id': str(db.get("databaseId")),
+        'database_name': db.get("name"),
+        'usage': {'memory_bytes': memory, 'throughput_ops': ops},
+        'target': target,
+        'current_price_hourly': current_price,
+        # Databases that cannot be priced under the scenario keep their current price
+        'projected_price_hourly': suggestion['price'] if suggestion else current_price,
+        'configuration': suggestion['configuration'] if suggestion else None,
+        'projected': suggestion is not None
+    }
+
+def run_what_if(scenario):
+    """
+    Right-size every database in the cached inventory to the scenario's usage and
+    price it. Yields one result per subscription as its database list arrives,
+    then the fleet totals. Only databases with a current price count towards totals.
+    """
+    usage = fetch_usage(scenario['quantile'], scenario['lookback'])
+    totals = {'current_price_hourly': 0.0, 'projected_price_hourly': 0.0, 'databases': 0, 'projected': 0, 'unpriced': 0}
+    subscriptions = throughput.get_subscriptions_cached()
+    for sub, databases in throughput.iter_subscription_database_lists(subscriptions):
+        pricing_list = sub.get("subscriptionPricing") or throughput.get_pricing_for_subscription(sub.get("id"))
+        results = []
+        current_total = 0.0
+        projected_total = 0.0
+        for db in databases:
+            if db.get("activeActiveRedis") and db.get("crdbDatabases"):
+                continue
+            result = simulate_database(sub, db, usage, scenario, pricing_list)
+            results.append(result)
+            totals['databases'] += 1
+            if result['current_price_hourly'] is None:
+                totals['unpriced'] += 1
+                continue
+            current_total += result['current_price_hourly']
+            projected_total += result['projected_price_hourly']
+            totals['projected'] += result['projected']
+        totals['current_price_hourly'] += current_total
+        totals['projected_price_hourly'] += projected_total
+        yield {
+            'type': 'subscription',
+            'subscription_id': sub.get("id"),
+            'subscription_name': sub.get("name"),
+            'current_price_hourly': round(current_total, 4),
+            'projected_price_hourly': round(projected_total, 4),
+            'databases': results
+        }
+    totals['current_price_hourly'] = round(totals['current_price_hourly'], 4)
+    totals['projected_price_hourly'] = round(totals['projected_price_hourly'], 4)
+    totals['savings_hourly'] = round(totals['current_price_hourly'] - totals['projected_price_hourly'], 4)
+    yield dict(totals, type='totals', scenario=scenario)
+
+def stream_what_if(scenario):
+    """run_what_if() as newline-delimited JSON; a failure is reported as an 'error' line"""
+    try:
+        for item in run_what_if(scenario):
+            yield json.dumps(item) + '\n'
+    except Exception as e:
+        yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'